@@ -0,0 +1,199 @@
+# Keyword-list の高速読み込み（必要列のみストリーミング）と内容ハッシュ単位のキャッシュ
+# 仕様:
+# - openpyxl の read_only モードでブックを1回だけ開き、Sheet1（無ければ先頭シート）の必要列だけ読む
+# - 値の整形は従来の pandas.read_excel + clean_series と同じ結果にそろえる
+#   （既定の欠損文字列 "NA" / "null" なども除外、数値だけの列は欠損か小数があれば float 表記 '1.0'、
+#    str 化して前後空白除去・空を除外・出現順で重複除去）
+# - read_only ではシートの <dimension> を信用せず reset_dimensions() してから読む（他ツール製の古い値対策）
+# - 列名はヘッダ行から作る（ヘッダの無い列にだけ値があるケースの 'Unnamed: n' 列は出さない）
+# - 整形済みの列ごとのユニーク値を、ファイル内容の SHA-256 をキーに JSON で保存
+#   （同じファイルの再実行や列選択の変更ではブックを開かない）
+
+import hashlib
+import json
+import logging
+import math
+import re
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+CACHE_DIR_NAME = ".cache_keyword"
+CACHE_VERSION = 2  # 整形規則を変えたら上げる（古いキャッシュは読み直し）
+HASH_CHUNK = 1 << 20
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# pandas.read_excel が既定（keep_default_na=True）で欠損とみなす文字列。前後空白は詰めずに完全一致で判定
+NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+# pandas の数値推定で数値として読まれる文字列（"12" / "1.5" / "1e3"）
+NUMERIC_RE = re.compile(r"^\s*[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?\s*$")
+
+
+def normalize_cell(x):
+    """pandas.read_excel と同じセル値の解釈。欠損は None、整数値の float は int にする"""
+    if x is None:
+        return None
+    if isinstance(x, str):
+        return None if x in NA_STRINGS else x
+    if isinstance(x, float):
+        if math.isnan(x):
+            return None
+        if x.is_integer():
+            return int(x)
+    return x
+
+
+def as_number(v):
+    """pandas の数値推定で数値になる値なら int / float、ならなければ None（"12" のような文字列も数値）"""
+    if isinstance(v, (int, float)):
+        return int(v) if isinstance(v, bool) else v
+    if isinstance(v, str) and NUMERIC_RE.match(v):
+        s = v.strip()
+        return int(s) if s.lstrip("+-").isdigit() else float(s)
+    return None
+
+
+def clean_column(values: list, has_na: bool, only_bool: bool = False) -> list:
+    """列のユニーク値（normalize_cell 済み・出現順）を clean_series と同じ文字列にする。
+    pandas と同じく、全値が数値（数値文字列・bool を含む）の列は数値列として扱い、
+    欠損 か 小数 があれば float64（1 も '1.0'）、無ければ int64。bool だけ（only_bool）で欠損の無い列は 'True' のまま"""
+    nums = [as_number(v) for v in values]
+    numeric = bool(values) and all(n is not None for n in nums)
+    if numeric and not has_na and only_bool:
+        numeric = False
+    as_float = numeric and (has_na or any(isinstance(n, float) for n in nums))
+    out = {}
+    for v, n in zip(values, nums):
+        if numeric:
+            v = float(n) if as_float else n
+        s = str(v).strip()
+        if s:
+            out.setdefault(s, None)
+    return list(out)
+
+
+def header_names(raw_header, width: int) -> list:
+    """pandas.read_excel と同じ列名にそろえる（空欄は 'Unnamed: n'、重複は '.1', '.2' ...）"""
+    raw = list(raw_header) + [None] * max(0, width - len(raw_header))
+    names, seen = [], {}
+    for i, v in enumerate(raw):
+        name = f"Unnamed: {i}" if v is None or str(v).strip() == "" else str(v)
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f"{base}.{seen[base]}"
+        seen[name] = 0
+        names.append(name)
+    return names
+
+
+def pick_sheet(wb, preferred: str):
+    if preferred in wb.sheetnames:
+        return wb[preferred]
+    first = wb.sheetnames[0]
+    logging.warning(f"'{preferred}' が見つからないため、'{first}' を読み込みます。")
+    return wb[first]
+
+
+def open_book(input_path: Path):
+    """ストリーミング読み込み用に開く（呼び出し側で close する）"""
+    return load_workbook(input_path, read_only=True, data_only=True)
+
+
+def read_header(wb, preferred_sheet: str):
+    """(シート名, 列名リスト) を返す。ヘッダ行以外は読まない"""
+    ws = pick_sheet(wb, preferred_sheet)
+    ws.reset_dimensions()
+    first = list(next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ()))
+    while first and first[-1] in (None, ""):
+        first.pop()
+    return ws.title, header_names(first, len(first))
+
+
+def read_clean_columns(wb, sheet: str, columns: list, targets: list) -> dict:
+    """targets（列名）の整形済みユニーク値を 1 回の走査で読み込む"""
+    ws = wb[sheet]
+    ws.reset_dimensions()
+    idx = {name: columns.index(name) for name in targets}
+    uniq = {name: {} for name in targets}   # 出現順のユニーク値（pandas と同じく True と 1 は同じ値として先勝ち）
+    first_na = {name: None for name in targets}
+    only_bool = {name: True for name in targets}
+    last_data_row = 0
+    for r, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+        # pandas は末尾の空行を読まないので、欠損は「後ろに値のある行」があるときだけ数える
+        if any(v not in (None, "") for v in row):
+            last_data_row = r
+        for name, j in idx.items():
+            v = normalize_cell(row[j]) if j < len(row) else None
+            if v is None:
+                if first_na[name] is None:
+                    first_na[name] = r
+            else:
+                uniq[name].setdefault(v, None)
+                if not isinstance(v, bool):
+                    only_bool[name] = False
+    return {
+        name: clean_column(
+            list(uniq[name]),
+            first_na[name] is not None and first_na[name] <= last_data_row,
+            only_bool[name],
+        )
+        for name in targets
+    }
+
+
+class KeywordCache:
+    """1 ファイル（内容ハッシュ）分のキャッシュ。values は 列名 -> 整形済みユニーク値"""
+
+    def __init__(self, path: Path, sha256: str, source: str, sheet=None, columns=None, values=None):
+        self.path = path
+        self.sha256 = sha256
+        self.source = source
+        self.sheet = sheet
+        self.columns = columns
+        self.values = values or {}
+
+    @classmethod
+    def open(cls, input_path: Path, sha256: str):
+        cache_dir = input_path.parent / CACHE_DIR_NAME
+        path = cache_dir / f"{sha256}.json"
+        cache = cls(path, sha256, input_path.name)
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                if data.get("version") == CACHE_VERSION and data.get("sha256") == sha256:
+                    cache.sheet = data["sheet"]
+                    cache.columns = data["columns"]
+                    cache.values = data["values"]
+            except (ValueError, KeyError) as e:
+                logging.warning(f"キャッシュを読み込めないため作り直します: {path.name} ({e})")
+        return cache
+
+    @property
+    def has_header(self) -> bool:
+        return self.sheet is not None and self.columns is not None
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": CACHE_VERSION,
+            "sha256": self.sha256,
+            "source": self.source,
+            "sheet": self.sheet,
+            "columns": self.columns,
+            "values": self.values,
+        }
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
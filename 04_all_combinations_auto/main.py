@@ -8,6 +8,11 @@ import sys
 import re
 import glob
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline_common.tracing import Tracer, StageProfiler
+
+from keyword_ingest import KeywordCache, file_sha256, open_book, read_clean_columns, read_header
+
 # =============================
 # 設定
 # =============================
@@ -38,6 +43,9 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
+# 実行全体のトレース（入力ファイルと同じフォルダの log_trace/ に保存）
+TRACER = Tracer("04")
+
 # =============================
 # ユーティリティ
 # =============================
@@ -85,33 +93,46 @@ def choose_file(files):
                 print("無効な入力です。")
 
 
-def read_excel_any(input_path: Path) -> pd.DataFrame:
+def load_value_lists(input_path: Path, pick_columns):
+    """列名を pick_columns で選ばせ、(対象列, 各列の整形済みユニーク値) を返す。
+    内容ハッシュが同じファイルはキャッシュから読み、未キャッシュの列だけブックを走査します。
+    """
+    with TRACER.span("hash_input", file=input_path.name):
+        sha = file_sha256(input_path)
+    cache = KeywordCache.open(input_path, sha)
+    wb = None
     try:
-        df = pd.read_excel(input_path, sheet_name=DEFAULT_SHEET_NAME, engine="openpyxl")
-    except Exception:
-        xls = pd.ExcelFile(input_path, engine="openpyxl")
-        first = xls.sheet_names[0]
-        logging.warning(f"'{DEFAULT_SHEET_NAME}' が見つからないため、'{first}' を読み込みます。")
-        df = pd.read_excel(input_path, sheet_name=first, engine="openpyxl")
-    return df
-
-
-def clean_series(s: pd.Series) -> pd.Series:
-    s2 = s.map(lambda x: str(x).strip() if pd.notna(x) else x)
-    s2 = s2.dropna()
-    s2 = s2[s2 != ""]
-    return s2.drop_duplicates()
-
-def confirm_or_pick_columns(df: pd.DataFrame) -> list:
-    cols = list(df.columns)
+        if cache.has_header:
+            logging.info(f"キャッシュを使用します: {cache.path.name}（シート '{cache.sheet}'）")
+        else:
+            with TRACER.span("read_header", file=input_path.name) as sp:
+                wb = open_book(input_path)
+                cache.sheet, cache.columns = read_header(wb, DEFAULT_SHEET_NAME)
+                sp.set(sheet=cache.sheet, columns=len(cache.columns))
+
+        target_columns = pick_columns(cache.columns)
+        missing = [c for c in target_columns if c not in cache.values]
+        if missing:
+            with TRACER.span("read_clean_columns", sheet=cache.sheet, columns=len(missing)) as sp:
+                if wb is None:
+                    wb = open_book(input_path)
+                cache.values.update(read_clean_columns(wb, cache.sheet, cache.columns, missing))
+                sp.set(rows=sum(len(cache.values[c]) for c in missing))
+            cache.save()
+    finally:
+        if wb is not None:
+            wb.close()
+    return target_columns, [cache.values[c] for c in target_columns]
+
+def confirm_or_pick_columns(cols: list, ask=input) -> list:
     print("\n▼ 検出された列：")
     for i, c in enumerate(cols, 1):
         print(f"  {i}. {c}")
-    ans = input("上記すべてを対象列として使用しますか？ (y=すべて / n=選択): ").strip().lower()
+    ans = ask("上記すべてを対象列として使用しますか？ (y=すべて / n=選択): ").strip().lower()
     if ans == "y":
         return cols
     while True:
-        sel = input("使用する列番号をカンマ区切りで入力（例: 1,3,4）: ").strip()
+        sel = ask("使用する列番号をカンマ区切りで入力（例: 1,3,4）: ").strip()
         if not sel:
             print("少なくとも1つ選択してください。")
             continue
@@ -123,7 +144,7 @@ def confirm_or_pick_columns(df: pd.DataFrame) -> list:
                     picked.append(cols[i - 1])
             if picked:
                 print("選択列:", picked)
-                ans2 = input("この列でよろしいですか？ (y/n): ").strip().lower()
+                ans2 = ask("この列でよろしいですか？ (y/n): ").strip().lower()
                 if ans2 == "y":
                     return picked
         except ValueError:
@@ -168,10 +189,12 @@ def write_csv_in_parts_unique(base_out: Path, header_cols: list, rows_iter, tota
     written_total = 0
     buffer = []
     start_time = time.time()
+    fill_t0 = time.perf_counter()
     pbar = tqdm(iterable=rows_iter, total=total_rows, unit="row")
     for row in pbar:
         buffer.append(row)
         if len(buffer) >= WRITE_CHUNK_SIZE:
+            TRACER.record("iter_product", time.perf_counter() - fill_t0, rows=len(buffer))
             while buffer:
                 remain_cap = CSV_PART_ROWS - (written_total % CSV_PART_ROWS)
                 take = min(len(buffer), remain_cap)
@@ -179,13 +202,18 @@ def write_csv_in_parts_unique(base_out: Path, header_cols: list, rows_iter, tota
                 buffer = buffer[take:]
                 current_part = (written_total // CSV_PART_ROWS) + 1
                 out_path = part_path(current_part)
-                df_chunk = pd.DataFrame.from_records(chunk, columns=header_cols)
-                header = not out_path.exists() or (written_total % CSV_PART_ROWS == 0)
-                df_chunk.to_csv(out_path, mode="a", index=False, header=header, encoding="utf-8-sig")
+                with TRACER.span("to_csv", rows=len(chunk), part=current_part):
+                    df_chunk = pd.DataFrame.from_records(chunk, columns=header_cols)
+                    header = not out_path.exists() or (written_total % CSV_PART_ROWS == 0)
+                    df_chunk.to_csv(out_path, mode="a", index=False, header=header, encoding="utf-8-sig")
                 written_total += len(chunk)
                 elapsed = time.time() - start_time
                 speed = written_total / max(elapsed, 1)
                 pbar.set_description(f"wrote: {written_total:,} rows @ {speed:,.0f} r/s")
+            fill_t0 = time.perf_counter()
+
+    if buffer:
+        TRACER.record("iter_product", time.perf_counter() - fill_t0, rows=len(buffer))
 
     while buffer:
         remain_cap = CSV_PART_ROWS - (written_total % CSV_PART_ROWS)
@@ -194,9 +222,10 @@ def write_csv_in_parts_unique(base_out: Path, header_cols: list, rows_iter, tota
         buffer = buffer[take:]
         current_part = (written_total // CSV_PART_ROWS) + 1
         out_path = part_path(current_part)
-        df_chunk = pd.DataFrame.from_records(chunk, columns=header_cols)
-        header = not out_path.exists() or (written_total % CSV_PART_ROWS == 0)
-        df_chunk.to_csv(out_path, mode="a", index=False, header=header, encoding="utf-8-sig")
+        with TRACER.span("to_csv", rows=len(chunk), part=current_part):
+            df_chunk = pd.DataFrame.from_records(chunk, columns=header_cols)
+            header = not out_path.exists() or (written_total % CSV_PART_ROWS == 0)
+            df_chunk.to_csv(out_path, mode="a", index=False, header=header, encoding="utf-8-sig")
         written_total += len(chunk)
         elapsed = time.time() - start_time
         speed = written_total / max(elapsed, 1)
@@ -216,9 +245,18 @@ def main():
     input_file = choose_file(files)
     logging.info(f"入力ファイル: {input_file}")
 
-    df = read_excel_any(input_file)
-    target_columns = confirm_or_pick_columns(df)
-    value_lists = [clean_series(df[col]).tolist() for col in target_columns]
+    # --profile 指定時のみ cProfile / tracemalloc を有効化（出力は入力ファイルと同じフォルダ）
+    # 列選択・実行確認の入力待ちは profiler.ask() で計測から外す
+    profiler = StageProfiler("04")
+    try:
+        with profiler.profile(input_file.parent, TRACER.run_ts):
+            run(input_file, profiler.ask)
+    finally:
+        trace_path = TRACER.save(input_file.parent)
+        logging.info(f"トレース出力: {trace_path}")
+
+def run(input_file: Path, ask=input):
+    target_columns, value_lists = load_value_lists(input_file, lambda cols: confirm_or_pick_columns(cols, ask))
     counts = [len(v) for v in value_lists]
     total_rows = prod(counts) if counts else 0
 
@@ -230,7 +268,7 @@ def main():
     if total_rows == 0:
         raise SystemExit("組み合わせ対象がありません（ユニーク値が空）。")
 
-    ans = input("この処理を実行しますか？ (y/n): ").strip().lower()
+    ans = ask("この処理を実行しますか？ (y/n): ").strip().lower()
     if ans != "y":
         raise SystemExit("中止しました。")
 
@@ -239,7 +277,9 @@ def main():
 
     rows_iter_all = iter_product(value_lists)
     logging.info("CSV分割出力を開始します。")
-    written, parts, base_used = write_csv_in_parts_unique(csv_base, target_columns, rows_iter_all, total_rows)
+    with TRACER.span("write_csv_in_parts_unique", expected_rows=total_rows) as sp:
+        written, parts, base_used = write_csv_in_parts_unique(csv_base, target_columns, rows_iter_all, total_rows)
+        sp.set(rows=written, parts=parts)
     logging.info(f"CSV出力完了: {written:,} 行 / {parts} ファイル / ベース: {base_used.name}")
     logging.info("処理が完了しました。")
 
@@ -0,0 +1,76 @@
+# 05 の深掘り検索（2ページ目以降を start パラメータで取得）
+# 仕様:
+# - 1ページ目で新しいドメインが1件も増えなければ、2ページ目以降は取得しない
+#   （既知ドメイン = 呼び出し側の all_domains + このクエリでここまでに出たドメイン）
+# - 2ページ目以降はウェーブ単位で取得し、ウェーブの全ページが新規ドメインを増やしている間だけ
+#   次のウェーブの並列数を 1 → 2 → … → concurrency と広げる（レート制御は呼び出し側の共有リミッタ）
+#   ※ 2ページ目は常に単独で取得するため、実際に並列取得が起きるのは max_pages >= 4 のとき
+# - executor を渡すとそれを使う（実行全体で1つを共有し、スレッドごとの API クライアントを使い回すため）。
+#   省略時はこのクエリ用に作って閉じる
+# - 新規ドメインを増やさないページ・取得失敗・結果件数がページサイズ未満（最終ページ）が出たら打ち切る
+# - 返り値は各結果の dict（link / title / snippet / displayLink に page / rank を付与）
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from row_search import get_domain
+
+PAGE_SIZE = 10
+MAX_START = 91  # Custom Search API は start + num <= 100 まで
+
+
+def page_starts(max_pages):
+    return [1 + PAGE_SIZE * p for p in range(max_pages) if 1 + PAGE_SIZE * p <= MAX_START]
+
+
+def annotate(items, page, start):
+    out = []
+    for k, item in enumerate(items):
+        d = dict(item)
+        d["page"] = page
+        d["rank"] = start + k
+        out.append(d)
+    return out
+
+
+def page_domains(items):
+    return {get_domain(it.get("link", "")) for it in items}
+
+
+def deep_search(query, fetch_page, known_domains, max_pages, concurrency=2, executor=None):
+    """fetch_page(query, start) -> items を使って最大 max_pages ページ分の結果を返す"""
+    starts = page_starts(max_pages)
+    first = fetch_page(query, starts[0])
+    results = annotate(first, 1, starts[0])
+    seen = set(known_domains)
+    domains = page_domains(first)
+    if len(starts) == 1 or len(first) < PAGE_SIZE or not (domains - seen):
+        return results
+
+    seen |= domains
+    rest = starts[1:]
+    width = 1
+    owned = executor is None
+    ex = ThreadPoolExecutor(max_workers=max(1, concurrency)) if owned else executor
+    with ex if owned else nullcontext(ex):
+        while rest:
+            wave, rest = rest[:width], rest[width:]
+            futures = [ex.submit(fetch_page, query, s) for s in wave]
+            stop = False
+            for s, fut in zip(wave, futures):
+                try:
+                    items = fut.result()
+                except Exception as e:
+                    print(f"[WARN] 追加ページ取得失敗: {query} (start={s}) :: {e}")
+                    stop = True
+                    continue
+                page = (s - 1) // PAGE_SIZE + 1
+                results += annotate(items, page, s)
+                domains = page_domains(items)
+                if not (domains - seen) or len(items) < PAGE_SIZE:
+                    stop = True
+                seen |= domains
+            if stop:
+                break
+            width = min(width + 1, max(1, concurrency))
+    return results
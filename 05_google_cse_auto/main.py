@@ -4,24 +4,41 @@
 # - 処理対象は "searched_URL" が空の行のみ（未処理判定）
 # - 処理件数は 'all' または 数値で指定
 # - 未処理からランダム抽出で処理（重複なし）。抽出例を表示
+#   部分実行では「収量優先」も選択可（過去の新規ドメイン数から学習。期待/実測収量を表示）
 # - 検索結果がゼロでも必ず "--- row_start ---" を書き込んで「処理済み」痕跡を残す
 # - Aへ書き戻し: Excelは該当シートを置換保存 / CSVは上書き保存
 # - Bは「今回処理した分のみ」のデルタログを CWD/log_Searched/ に出力（timestamp & processed_at列付与）
 # - ドメイン重複は“今回処理バッチ内”で重複しないように制御（シート単位）
+# - URL は正規化して log_Searched/url_table.sqlite に登録（ID・初出/最終確認日時）。
+#   今回初めて見た URL はシートごとに log_Searched/url_new(<シート>)_<ファイル名>__<timestamp>.csv に出力
+# - 検索結果のタイトル・スニペット・表示ドメイン・順位は log_Searched/results(<シート>)_*.parquet に保存
+# - DEEP_MAX_PAGES > 1 で2ページ目以降も取得（1ページ目を含め、新規ドメインが増えないページが出たら打ち切り）
 
 import os
+import sys
+import threading
 import time
 import random
 import glob
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from urllib.parse import urlparse
 
 import pandas as pd
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from tqdm import tqdm
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline_common.tracing import Tracer, StageProfiler
+from pipeline_common.url_table import ROW_COLUMNS, UrlTable
+
+from search_metrics import SearchMetrics
+from row_search import ROW_START, build_query, search_row
+from prioritize import YieldStats, expected_total, row_arms, select_rows
+from deep_search import PAGE_SIZE, annotate, deep_search
+from result_table import ResultTable
+
 # ==== 環境変数からAPIキーとCSE IDを取得 ====
 API_KEY = os.environ.get("google_search_api_key")
 CSE_ID = os.environ.get("google_search_engine_id")
@@ -35,11 +52,60 @@ MAX_RETRIES = 6
 BACKOFF_FACTOR = 2.0
 JITTER_RANGE = (0.05, 0.25)
 
-# 1プロセスで使い回す
-_GOOGLE_SERVICE = None
-
-def throttle_wait(delay=BASE_DELAY):
-    time.sleep(delay + random.uniform(*JITTER_RANGE))
+# ==== 深掘り検索 ====
+# 1: 従来どおり1ページ目（上位10件）のみ / 2以上: start パラメータで最大このページ数まで取得
+DEEP_MAX_PAGES = 1
+DEEP_CONCURRENCY = 2  # 同時に取得する最大ページ数（新規ドメインが増え続ける間だけ 1 から広げる。レート制御は全スレッド共有）
+# ※ 2ページ目は常に単独で取得するため、実際に並列取得が起きるのは DEEP_MAX_PAGES >= 4 のとき
+RESULT_FIELDS = ("link", "title", "snippet", "displayLink")
+
+# ==== URL テーブル ====
+# True: searched_URL には URL の代わりに "#<id>" を書く（URL 本体は url_table.sqlite、07 で展開）
+# False: 正規化済み URL をそのまま書く
+STORE_URL_IDS = False
+RUN_STARTED = datetime.now().strftime("%Y%m%d-%H%M%S")
+url_tables = {}  # 入力フォルダ -> UrlTable
+yield_stats_by_dir = {}  # 入力フォルダ -> YieldStats（log_Searched/yield_stats.json）
+
+# 1プロセスで使い回す（httplib2 はスレッド間で共有できないためスレッドごとに1つ）
+_GOOGLE_SERVICE = threading.local()
+# 深掘りの追加ページ取得用。実行全体で1つを使い回す（クエリごとに作るとスレッドごとの service / 接続を毎回作り直すため）
+DEEP_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, DEEP_CONCURRENCY)) if DEEP_MAX_PAGES > 1 else None
+
+# 実行全体のメトリクス（最後に log_Searched/ へ JSON と Prometheus textfile で出力）
+METRICS = SearchMetrics()
+
+# ステージ横断トレース（log_Searched/log_trace/ に保存）と --profile 指定時のプロファイル
+TRACER = Tracer("05")
+PROFILER = StageProfiler("05")  # フォルダ選択後に開始
+
+class RateLimiter:
+    """全スレッド共有のレート制御: API 呼び出しの開始間隔を delay + ジッタ 以上空ける"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.delay + random.uniform(*JITTER_RANGE)
+        sleep_s = slot - now
+        if sleep_s > 0:
+            time.sleep(sleep_s)
+        return sleep_s
+
+    def defer(self, sec):
+        """429 などのバックオフ中は他スレッドも呼び出さないよう次の枠を後ろにずらす"""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + sec)
+
+RATE_LIMITER = RateLimiter(BASE_DELAY)
+
+def throttle_wait():
+    METRICS.add_seconds("throttle_wait", RATE_LIMITER.wait())
 
 # ==== 重複回避のための保存パス生成（接頭辞で連番） ====
 
@@ -58,45 +124,78 @@ def get_unique_path_prefix(path_str: str) -> str:
 
 # ==== Google検索 ====
 
-def google_search(query, api_key, cse_id, num=10):
-    global _GOOGLE_SERVICE
-    if _GOOGLE_SERVICE is None:
-        _GOOGLE_SERVICE = build("customsearch", "v1", developerKey=api_key, cache_discovery=False)
+def google_search_items(query, api_key, cse_id, num=10, start=1):
+    """1ページ分の検索結果を [{link, title, snippet, displayLink}, ...] で返す"""
+    service = getattr(_GOOGLE_SERVICE, "service", None)
+    if service is None:
+        service = build("customsearch", "v1", developerKey=api_key, cache_discovery=False)
+        _GOOGLE_SERVICE.service = service
+    METRICS.inc("pages")
+    if start > 1:
+        METRICS.inc("deep_pages")
     delay = BASE_DELAY
     for attempt in range(1, MAX_RETRIES + 1):
+        throttle_wait()
+        t0 = time.perf_counter()
         try:
-            res = _GOOGLE_SERVICE.cse().list(q=query, cx=cse_id, num=num).execute()
-            throttle_wait(BASE_DELAY)
-            return [item["link"] for item in res.get("items", [])]
+            res = service.cse().list(q=query, cx=cse_id, num=num, start=start).execute()
+            METRICS.observe_call(time.perf_counter() - t0)
+            return [{k: item.get(k) for k in RESULT_FIELDS} for item in res.get("items", []) if item.get("link")]
         except HttpError as e:
+            METRICS.observe_call(time.perf_counter() - t0)
             status = getattr(e.resp, "status", None)
             if status == 429 or (status and 500 <= status < 600):
                 sleep_s = delay + random.uniform(*JITTER_RANGE)
                 print(f"[{status}] retry {attempt}/{MAX_RETRIES} after {sleep_s:.2f}s")
+                METRICS.observe_retry(status, sleep_s)
+                RATE_LIMITER.defer(sleep_s)
                 time.sleep(sleep_s)
                 delay *= BACKOFF_FACTOR
                 continue
             raise
         except Exception:
-            throttle_wait(BASE_DELAY)
+            METRICS.observe_call(time.perf_counter() - t0)
+            METRICS.observe_retry(None, 0.0)
             if attempt == MAX_RETRIES:
                 raise
+    METRICS.inc("failed_queries" if start == 1 else "failed_pages")
     return []
 
-# ==== 独自ドメイン抽出 ====
+def search_items(query, known_domains):
+    """行のクエリを検索し、結果 dict（page / rank 付き）のリストを返す。DEEP_MAX_PAGES > 1 なら深掘り
+    （メトリクスはページ数によらず 1 クエリとして記録し、ページ数は別に記録）"""
+    pages = []
 
-def get_domain(url):
+    def fetch_page(q, start):
+        pages.append(start)
+        return google_search_items(q, API_KEY, CSE_ID, num=PAGE_SIZE, start=start)
+
+    items = []
     try:
-        netloc = urlparse(url).netloc
-        return netloc.lower().lstrip("www.")
-    except Exception:
-        return url
+        if DEEP_MAX_PAGES > 1:
+            items = deep_search(query, fetch_page, known_domains, DEEP_MAX_PAGES, DEEP_CONCURRENCY, DEEP_EXECUTOR)
+        else:
+            items = annotate(fetch_page(query, 1), 1, 1)
+        return items
+    finally:
+        METRICS.observe_query(len(items), len(pages))
+
+def save_new_urls(table, ids, path: Path):
+    """今回初めて登録した URL（ids）を CSV に出力する"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(table.rows(ids), columns=ROW_COLUMNS).to_csv(path, index=False, encoding="utf-8-sig")
+
+def collect_links(items, sink):
+    """結果 dict を sink（サイドテーブル用）に溜め、リンクだけを返す"""
+    sink.extend(items)
+    return [item["link"] for item in items]
 
 # =========================
 # ① 同階層の「フォルダ」を列挙して選択（allなし・カンマ区切り可）
 # =========================
 SCRIPT_DIR = Path(__file__).resolve().parent
-dirs_1depth = sorted([p for p in SCRIPT_DIR.iterdir() if p.is_dir()])
+# __pycache__（同じフォルダの補助モジュールの import で作られる）や隠しフォルダは候補に出さない
+dirs_1depth = sorted([p for p in SCRIPT_DIR.iterdir() if p.is_dir() and p.name != "__pycache__" and not p.name.startswith(".")])
 
 if not dirs_1depth:
     raise FileNotFoundError("同じフォルダ直下にサブフォルダが見つかりません。")
@@ -128,210 +227,281 @@ def collect_candidate_files(base_dir: Path):
 # =========================
 # ③ 各フォルダごとにファイル→シート/CSVを処理（事前スキャン→未処理だけ処理）
 # =========================
-for selected_dir in target_dirs:
-    files = collect_candidate_files(selected_dir)
-    if not files:
-        print(f"[WARN] フォルダ '{selected_dir.name}' に対象ファイル(.xlsx/.csv)が見つかりません。スキップします。")
-        continue
-
-    print("\n" + "="*72)
-    print(f"▶ フォルダ: {selected_dir.name}")
-    print("処理するファイルを選択してください:")
-    for i, p in enumerate(files, start=1):
-        print(f"{i}: {p.name}")
-    n_files = len(files)
-    raw_file_pick = input(f"番号（1〜{n_files}。カンマ区切りで複数可）: ").strip()
-    idxs = sorted({int(x.strip()) for x in raw_file_pick.split(",") if x.strip().isdigit()})
-    if not idxs:
-        raise ValueError(f"ファイル番号の入力が不正です。1〜{n_files} の範囲で指定してください。")
-    target_files = [files[i-1] for i in idxs if 1 <= i <= n_files]
-
-    for input_path in target_files:
-        print("\n" + "-"*72)
-        print(f"▶ ファイル処理開始: {input_path.name}")
-        is_excel = input_path.suffix.lower() == ".xlsx"
-
-        # ---- シート選択（Excelのみは all 可）----
-        if is_excel:
-            excel = pd.ExcelFile(input_path)
-            print("処理するシートを選択してください:")
-            for idx, name in enumerate(excel.sheet_names, start=1):
-                print(f"{idx}: {name}")
-            n_sheets = len(excel.sheet_names)
-            raw = input(f"番号（1〜{n_sheets}。カンマ区切り または all）: ").strip().lower()
-            if raw == "all":
-                target_sheets = excel.sheet_names
-            else:
-                indices = []
-                for token in raw.split(","):
-                    token = token.strip()
-                    if not token.isdigit():
-                        raise ValueError(f"不正な番号入力です: {token}")
-                    n = int(token)
-                    if not (1 <= n <= n_sheets):
-                        raise ValueError(f"番号が範囲外です: {n}（1〜{n_sheets}）")
-                    indices.append(n - 1)
-                indices = sorted(set(indices))
-                target_sheets = [excel.sheet_names[i] for i in indices]
-        else:
-            target_sheets = [None]  # CSV
-
-        # ---- 事前スキャン：各シート/CSVの行数と未処理数を先に読み込んで表示 ----
-        sheet_row_counts = {}
-        sheet_remaining_counts = {}
-        dfs_cache = {}
-        total_selected_rows = 0
-        total_remaining_rows = 0
-
-        for sheet_name in target_sheets:
-            if is_excel:
-                df = pd.read_excel(input_path, sheet_name=sheet_name)
-                label = sheet_name
-            else:
-                df = pd.read_csv(input_path)
-                label = "CSV"
-
-            if "searched_URL" not in df.columns:
-                df["searched_URL"] = ""
-
-            dfs_cache[label] = df
-            total_rows = len(df)
-            remaining_mask = df["searched_URL"].fillna("") == ""
-            remaining = int(remaining_mask.sum())
-
-            sheet_row_counts[label] = total_rows
-            sheet_remaining_counts[label] = remaining
-            total_selected_rows += total_rows
-            total_remaining_rows += remaining
-
-        print("------")
-        print("選択したシートごとの 未処理 / 総行数:")
-        for sheet in sheet_row_counts:
-            print(f" - {sheet}: 未処理={sheet_remaining_counts[sheet]} / 総行数={sheet_row_counts[sheet]}")
-        print(f"▶ 合計: 未処理={total_remaining_rows} / 総行数={total_selected_rows}")
-
-        # ---- 各シート/CSVの処理本体（未処理のみ、ランダム抽出、件数指定可） ----
-        for sheet_name in target_sheets:
+# 以降の対話入力はプロファイルから除外し、中断・例外時もトレース / プロファイル / メトリクスは必ず保存する
+# 保存先は処理中ファイルのフォルダの log_Searched/（未着手なら 選択フォルダが1つならその log_Searched/、複数ならスクリプト直下）
+diag_dir = target_dirs[0] / "log_Searched" if len(target_dirs) == 1 else SCRIPT_DIR
+PROFILER.start()
+try:
+    for selected_dir in target_dirs:
+        files = collect_candidate_files(selected_dir)
+        if not files:
+            print(f"[WARN] フォルダ '{selected_dir.name}' に対象ファイル(.xlsx/.csv)が見つかりません。スキップします。")
+            continue
+
+        print("\n" + "="*72)
+        print(f"▶ フォルダ: {selected_dir.name}")
+        print("処理するファイルを選択してください:")
+        for i, p in enumerate(files, start=1):
+            print(f"{i}: {p.name}")
+        n_files = len(files)
+        raw_file_pick = PROFILER.ask(f"番号（1〜{n_files}。カンマ区切りで複数可）: ").strip()
+        idxs = sorted({int(x.strip()) for x in raw_file_pick.split(",") if x.strip().isdigit()})
+        if not idxs:
+            raise ValueError(f"ファイル番号の入力が不正です。1〜{n_files} の範囲で指定してください。")
+        target_files = [files[i-1] for i in idxs if 1 <= i <= n_files]
+
+        for input_path in target_files:
+            print("\n" + "-"*72)
+            print(f"▶ ファイル処理開始: {input_path.name}")
+            diag_dir = input_path.parent / "log_Searched"
+            is_excel = input_path.suffix.lower() == ".xlsx"
+            if input_path.parent not in url_tables:
+                url_tables[input_path.parent] = UrlTable.for_dir(input_path.parent)
+            url_table = url_tables[input_path.parent]
+            if input_path.parent not in yield_stats_by_dir:
+                yield_stats_by_dir[input_path.parent] = YieldStats.for_dir(input_path.parent)
+            yield_stats = yield_stats_by_dir[input_path.parent]
+
+            # ---- シート選択（Excelのみは all 可）----
             if is_excel:
-                label = sheet_name
-                df = dfs_cache[label]
+                excel = pd.ExcelFile(input_path)
+                print("処理するシートを選択してください:")
+                for idx, name in enumerate(excel.sheet_names, start=1):
+                    print(f"{idx}: {name}")
+                n_sheets = len(excel.sheet_names)
+                raw = PROFILER.ask(f"番号（1〜{n_sheets}。カンマ区切り または all）: ").strip().lower()
+                if raw == "all":
+                    target_sheets = excel.sheet_names
+                else:
+                    indices = []
+                    for token in raw.split(","):
+                        token = token.strip()
+                        if not token.isdigit():
+                            raise ValueError(f"不正な番号入力です: {token}")
+                        n = int(token)
+                        if not (1 <= n <= n_sheets):
+                            raise ValueError(f"番号が範囲外です: {n}（1〜{n_sheets}）")
+                        indices.append(n - 1)
+                    indices = sorted(set(indices))
+                    target_sheets = [excel.sheet_names[i] for i in indices]
             else:
-                label = "CSV"
-                df = dfs_cache[label]
-
-            total_rows = len(df)
-            remaining_mask = df["searched_URL"].fillna("") == ""
-            remaining_indices = list(df.index[remaining_mask])
-            remaining = len(remaining_indices)
+                target_sheets = [None]  # CSV
+
+            # ---- 事前スキャン：各シート/CSVの行数と未処理数を先に読み込んで表示 ----
+            sheet_row_counts = {}
+            sheet_remaining_counts = {}
+            dfs_cache = {}
+            total_selected_rows = 0
+            total_remaining_rows = 0
+
+            for sheet_name in target_sheets:
+                with TRACER.span("read_sheet", file=input_path.name, sheet=sheet_name or "CSV") as sp:
+                    if is_excel:
+                        df = pd.read_excel(input_path, sheet_name=sheet_name)
+                        label = sheet_name
+                    else:
+                        df = pd.read_csv(input_path)
+                        label = "CSV"
+                    sp.set(rows=len(df))
+
+                if "searched_URL" not in df.columns:
+                    df["searched_URL"] = ""
+
+                dfs_cache[label] = df
+                total_rows = len(df)
+                remaining_mask = df["searched_URL"].fillna("") == ""
+                remaining = int(remaining_mask.sum())
+
+                sheet_row_counts[label] = total_rows
+                sheet_remaining_counts[label] = remaining
+                total_selected_rows += total_rows
+                total_remaining_rows += remaining
+
+            print("------")
+            print("選択したシートごとの 未処理 / 総行数:")
+            for sheet in sheet_row_counts:
+                print(f" - {sheet}: 未処理={sheet_remaining_counts[sheet]} / 総行数={sheet_row_counts[sheet]}")
+            print(f"▶ 合計: 未処理={total_remaining_rows} / 総行数={total_selected_rows}")
+
+            # ---- 各シート/CSVの処理本体（未処理のみ、ランダム抽出、件数指定可） ----
+            for sheet_name in target_sheets:
+                if is_excel:
+                    label = sheet_name
+                    df = dfs_cache[label]
+                else:
+                    label = "CSV"
+                    df = dfs_cache[label]
 
-            print(f"\n[ {label} ] 未処理: {remaining} / 総行数: {total_rows}")
-            if remaining == 0:
-                print("→ 未処理行はありません。スキップします。")
-                continue
+                total_rows = len(df)
+                remaining_mask = df["searched_URL"].fillna("") == ""
+                remaining_indices = list(df.index[remaining_mask])
+                remaining = len(remaining_indices)
 
-            # 処理件数の指定
-            ask = input(f"処理する行数を入力（'all' または 数値、最大 {remaining}）: ").strip().lower()
-            if ask in ("", "all"):
-                n_proc = remaining
-            else:
-                if not ask.isdigit():
-                    raise ValueError(f"不正な入力です（all または 数値）: {ask}")
-                n_proc = max(0, min(int(ask), remaining))
-
-            # ランダム抽出（未処理から重複なしで n_proc 件）
-            if n_proc > 0:
-                target_indices = random.sample(remaining_indices, k=n_proc)
-                target_indices.sort()  # 書き戻し時の視認性のため昇順
-            else:
-                target_indices = []
-            example_rows = [(idx + 1) for idx in target_indices[:min(5, len(target_indices))]]
-            print(f"→ 今回は ランダムに {n_proc} 行を処理します。例: {example_rows}")
-
-            # 検索実行（今回処理分）
-            all_domains = set()  # 同一シート内の今回の処理でドメイン重複を避ける
-            it = tqdm(range(n_proc), total=n_proc, desc=f"Google検索中 [{label}]")
-            for k in it:
-                i = target_indices[k]
-                row = df.iloc[i]
-                # 先頭3列をクエリに使う（存在しない列は無視）
-                cols = [row.iloc[j] if j < len(row) else None for j in range(3)]
-
-                # クエリが空なら処理済みマークのみ
-                if all(pd.isna(x) or str(x).strip() == "" for x in cols):
-                    df.at[i, "searched_URL"] = "--- row_start ---"
+                print(f"\n[ {label} ] 未処理: {remaining} / 総行数: {total_rows}")
+                if remaining == 0:
+                    print("→ 未処理行はありません。スキップします。")
                     continue
 
-                query = " ".join([str(x) for x in cols if pd.notna(x) and str(x).strip()])
-                try:
-                    urls = google_search(query, API_KEY, CSE_ID, num=10)
-                except Exception as e:
-                    print(f"[WARN] 検索失敗: {query} :: {e}")
-                    urls = []
-                urls_cleaned = [u.strip() for u in urls if u.strip()]
-
-                if urls_cleaned:
-                    content = "--- row_start ---\n" + "\n".join(urls_cleaned)
+                # 処理件数の指定
+                ask = PROFILER.ask(f"処理する行数を入力（'all' または 数値、最大 {remaining}）: ").strip().lower()
+                if ask in ("", "all"):
+                    n_proc = remaining
                 else:
-                    content = "--- row_start ---"  # 結果ゼロでも処理済み痕跡
-                # ドメイン重複除去（今回処理分に対して）
-                if content.strip() != "--- row_start ---":
-                    lines = content.split("\n")
-                    header = lines[0]
-                    uniq_urls = []
-                    for url in lines[1:]:
-                        domain = get_domain(url)
-                        if domain not in all_domains:
-                            uniq_urls.append(url)
-                            all_domains.add(domain)
-                    content = "\n".join([header] + uniq_urls) if uniq_urls else header
-
-                df.at[i, "searched_URL"] = content
-
-            # ==== (1) Aへ書き戻し（上書き）====
-            if is_excel:
-                from openpyxl import load_workbook  # 確実にopenpyxlを使う
-                # 既存ブックの当該シートを置換保存（他シートは保持）
-                with pd.ExcelWriter(input_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-                    df.to_excel(writer, sheet_name=label, index=False)
-                print(f"💾 Aへ書き戻し完了 → {input_path.name} / {label}")
-            else:
-                # CSV の場合は A=CSV をそのまま上書き
-                df.to_csv(input_path, index=False, encoding="utf-8-sig")
-                print(f"💾 A(CSV) を上書き保存 → {input_path.name}")
-
-            # ==== (2) B: ログを CWD/log_Searched/ に保存 ====
-# 仕様: ファイルA（対象シート）と同じ行・列構造を“空欄で”踏襲し、
-#       今回処理した行だけオリジナル内容を転記する（＝位置が分かるスパースログ）
-run_ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-
-# Aと同じ形（全セル空文字）のフレームを用意
-# ※元のdfは今回時点の最新（書き戻し反映済み）
-df_log = pd.DataFrame("", index=df.index, columns=df.columns)
-
-# 今回処理した行だけ、元dfの全列をそのまま転記
-if target_indices:
-    df_log.loc[target_indices, :] = df.loc[target_indices, :]
-
-# メタ情報列（processed_at）を付与（未処理行は空）
-if "processed_at" not in df_log.columns:
-    df_log["processed_at"] = ""
-if target_indices:
-    df_log.loc[target_indices, "processed_at"] = run_ts
-
-# 出力先: カレント直下 log_Searched/
-log_dir = input_path.parent / "log_Searched"
-log_dir.mkdir(parents=True, exist_ok=True)
-
-if is_excel:
-    out_name = f"searched({label})_{input_path.stem}__log_{run_ts}.xlsx"
-    output_path = log_dir / out_name
-    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-        df_log.to_excel(writer, sheet_name=label, index=False)
-    print(f"📝 ログ出力（B: スパースログ）: {output_path}")
-else:
-    out_name = f"searched({label})_{input_path.stem}__log_{run_ts}.csv"
-    output_path = log_dir / out_name
-    df_log.to_csv(output_path, index=False, encoding="utf-8-sig")
-    print(f"📝 ログ出力（B/CSV: スパースログ）: {output_path}")
+                    if not ask.isdigit():
+                        raise ValueError(f"不正な入力です（all または 数値）: {ask}")
+                    n_proc = max(0, min(int(ask), remaining))
+
+                # 抽出方法（部分実行のときのみ選択。既定はランダム）
+                mode = "random"
+                if 0 < n_proc < remaining:
+                    pick = PROFILER.ask("抽出方法を選択（1=ランダム / 2=収量優先）[1]: ").strip()
+                    if pick == "2":
+                        mode = "yield"
+
+                # 未処理から重複なしで n_proc 件
+                if n_proc > 0 and mode == "yield":
+                    target_indices, expected_yield = select_rows(df, remaining_indices, n_proc, yield_stats)
+                    target_indices.sort()  # 書き戻し時の視認性のため昇順
+                elif n_proc > 0:
+                    target_indices = random.sample(remaining_indices, k=n_proc)
+                    target_indices.sort()  # 書き戻し時の視認性のため昇順
+                    expected_yield = expected_total(df, target_indices, yield_stats)
+                else:
+                    target_indices = []
+                    expected_yield = None
+                example_rows = [(idx + 1) for idx in target_indices[:min(5, len(target_indices))]]
+                mode_label = "収量優先で" if mode == "yield" else "ランダムに"
+                print(f"→ 今回は {mode_label} {n_proc} 行を処理します。例: {example_rows}")
+
+                # 検索実行（今回処理分）
+                search_span = TRACER.begin("search_rows", sheet=label, rows=n_proc)
+                all_domains = set()  # 同一シート内の今回の処理でドメイン重複を避ける
+                observed_yield = 0
+                n_new_before = len(url_table.new_ids)
+                result_table = ResultTable()  # 結果メタデータ（Excel の外に保存）
+                it = tqdm(range(n_proc), total=n_proc, desc=f"Google検索中 [{label}]")
+                for k in it:
+                    i = target_indices[k]
+                    # 先頭3列をクエリに使う（存在しない列は無視）
+                    query = build_query(df.iloc[i])
+
+                    # クエリが空なら処理済みマークのみ
+                    if query is None:
+                        df.at[i, "searched_URL"] = ROW_START
+                        METRICS.inc("empty_rows")
+                        continue
+
+                    arms = row_arms(df.iloc[i])
+                    hosts_before = len(url_table.new_hosts)
+                    row_items = []
+                    df.at[i, "searched_URL"] = search_row(
+                        query, lambda q: collect_links(search_items(q, all_domains), row_items), all_domains, METRICS,
+                        url_table=url_table, seen_at=RUN_STARTED, store_ids=STORE_URL_IDS,
+                    )
+                    result_table.add(label, i, query, row_items, url_table)
+                    # 収量 = この行で初めて現れたホスト数（列の値ごとに学習）
+                    gained = len(url_table.new_hosts) - hosts_before
+                    yield_stats.update(arms, gained)
+                    observed_yield += gained
+                # 初出 URL の一覧はシートごとに、URL テーブルの確定（commit）より先に出力する
+                # （途中で止まっても「登録済みだが一覧に出ていない URL」を残さない）
+                sheet_new_ids = url_table.new_ids[n_new_before:]
+                if sheet_new_ids:
+                    new_path = input_path.parent / "log_Searched" / f"url_new({label})_{input_path.stem}__{RUN_STARTED}.csv"
+                    save_new_urls(url_table, sheet_new_ids, new_path)
+                    print(f"🔗 新規URL {len(sheet_new_ids)} 件: {new_path.name}")
+                url_table.commit()
+                search_span.end(domains=len(all_domains), new_hosts=observed_yield, results=len(result_table))
+
+                results_path = result_table.save(
+                    input_path.parent / "log_Searched", f"results({label})_{input_path.stem}__{RUN_STARTED}"
+                )
+                if results_path is not None:
+                    print(f"🗂 結果メタデータ {len(result_table)} 件: {results_path.name}")
+
+                yield_stats.record_run({
+                    "run": RUN_STARTED,
+                    "file": input_path.name,
+                    "sheet": label,
+                    "mode": mode,
+                    "rows": n_proc,
+                    "expected_new_domains": round(expected_yield, 2) if expected_yield is not None else None,
+                    "observed_new_domains": observed_yield,
+                })
+                yield_stats.save()
+                expected_label = f"{expected_yield:.1f}" if expected_yield is not None else "-（履歴なし）"
+                print(f"🎯 新規ドメイン: 期待 {expected_label} / 実測 {observed_yield}（{mode_label} {n_proc} 行）")
+
+                # ==== (1) Aへ書き戻し（上書き）====
+                if is_excel:
+                    from openpyxl import load_workbook  # 確実にopenpyxlを使う
+                    # 既存ブックの当該シートを置換保存（他シートは保持）
+                    with METRICS.time_write("excel"), TRACER.span("write_back", sheet=label, rows=len(df)):
+                        with pd.ExcelWriter(input_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+                            df.to_excel(writer, sheet_name=label, index=False)
+                    print(f"💾 Aへ書き戻し完了 → {input_path.name} / {label}")
+                else:
+                    # CSV の場合は A=CSV をそのまま上書き
+                    with METRICS.time_write("csv"), TRACER.span("write_back", sheet=label, rows=len(df)):
+                        df.to_csv(input_path, index=False, encoding="utf-8-sig")
+                    print(f"💾 A(CSV) を上書き保存 → {input_path.name}")
+
+                # ==== (2) B: ログを CWD/log_Searched/ に保存 ====
+    # 仕様: ファイルA（対象シート）と同じ行・列構造を“空欄で”踏襲し、
+    #       今回処理した行だけオリジナル内容を転記する（＝位置が分かるスパースログ）
+    run_ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    # Aと同じ形（全セル空文字）のフレームを用意
+    # ※元のdfは今回時点の最新（書き戻し反映済み）
+    df_log = pd.DataFrame("", index=df.index, columns=df.columns)
+
+    # 今回処理した行だけ、元dfの全列をそのまま転記
+    if target_indices:
+        df_log.loc[target_indices, :] = df.loc[target_indices, :]
+
+    # メタ情報列（processed_at）を付与（未処理行は空）
+    if "processed_at" not in df_log.columns:
+        df_log["processed_at"] = ""
+    if target_indices:
+        df_log.loc[target_indices, "processed_at"] = run_ts
+
+    # 出力先: カレント直下 log_Searched/
+    log_dir = input_path.parent / "log_Searched"
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    if is_excel:
+        out_name = f"searched({label})_{input_path.stem}__log_{run_ts}.xlsx"
+        output_path = log_dir / out_name
+        with METRICS.time_write("log_excel"), TRACER.span("write_log", rows=len(target_indices)):
+            with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
+                df_log.to_excel(writer, sheet_name=label, index=False)
+        print(f"📝 ログ出力（B: スパースログ）: {output_path}")
+    else:
+        out_name = f"searched({label})_{input_path.stem}__log_{run_ts}.csv"
+        output_path = log_dir / out_name
+        with METRICS.time_write("log_csv"), TRACER.span("write_log", rows=len(target_indices)):
+            df_log.to_csv(output_path, index=False, encoding="utf-8-sig")
+        print(f"📝 ログ出力（B/CSV: スパースログ）: {output_path}")
+
+    # ==== (3) URL テーブルを閉じる（初出 URL の一覧はシートごとに出力済み）====
+    for table in url_tables.values():
+        table.close()
+
+finally:
+    if DEEP_EXECUTOR is not None:
+        DEEP_EXECUTOR.shutdown(wait=True)
+
+    # ==== (4) メトリクス出力（JSON サマリ + Prometheus textfile。中断・例外時もそこまでの分を出力）====
+    metrics_json, metrics_prom = METRICS.save(diag_dir, RUN_STARTED)
+    summary = METRICS.to_dict()
+    print(f"📊 メトリクス出力: {metrics_json} / {metrics_prom.name}")
+    print(f"   API呼び出し={summary['counters']['api_calls']} / 429={summary['retries_429']} / 5xx={summary['retries_5xx']}"
+          f" / 通信={summary['seconds']['in_flight']}s / 待機={summary['seconds']['throttle_wait']}s"
+          f" / バックオフ={summary['seconds']['backoff']}s / ドメイン重複除去率={summary['dedupe_drop_rate']}")
+
+    # ==== (5) トレース / プロファイル出力 ====
+    print(f"🧭 トレース出力: {TRACER.save(diag_dir)}")
+    for p in PROFILER.stop(diag_dir, TRACER.run_ts):
+        print(f"🔬 プロファイル出力: {p}")
 
 print("\nすべての処理が完了しました。")
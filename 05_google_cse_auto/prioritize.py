@@ -0,0 +1,147 @@
+# 05 の部分実行向け 収量優先の行選択（バンディット方式）
+# 仕様:
+# - 過去の結果から「クエリ列の値ごとの新規ドメイン数」を学習し log_Searched/yield_stats.json に保存
+#   （列番号と値の組 = アーム。1行の新規ドメイン数をその行の各アームに加算）
+# - 新規ドメイン = URL テーブルに一度も現れていなかったホスト（新しい公式サイト候補）
+# - 選択は UCB1: 各アームの平均収量 + 探索ボーナス の行内平均が高い行から1行ずつ選ぶ。
+#   選んだ行のアームは、バッチ内で選ばれるたびに平均を BATCH_DECAY 倍し（同じ値の行は同じドメインを返しやすく、
+#   バッチ内では収量が逓減する）、仮の試行を足してボーナスも下げる。同じ値の行ばかりに偏らないようにする（同点はランダム）
+#   さらに EXPLORE_RATE の割合だけ残りからランダムに選ぶ（未知の値の探索）
+# - 実行ごとに「期待収量（選択時の推定）」と「実測収量」を記録・表示する（履歴が無い間は期待収量なし）
+
+import heapq
+import json
+import math
+import random
+from pathlib import Path
+
+import pandas as pd
+
+from row_search import QUERY_COLUMNS
+
+YIELD_STATS_NAME = "yield_stats.json"
+UCB_C = 1.0           # 探索ボーナスの係数
+EXPLORE_RATE = 0.1    # ランダム探索に回す割合
+PRIOR_PULLS = 1.0     # 未学習アームの平均収量を全体平均に寄せる強さ
+BATCH_DECAY = 0.85     # 同じバッチで同じ値の行を選ぶたびに、その値の期待収量に掛ける係数
+
+
+def row_arms(row, n_cols=QUERY_COLUMNS):
+    """行のクエリ列の値をアーム名（"列番号:値"）のリストで返す"""
+    arms = []
+    for j in range(min(n_cols, len(row))):
+        x = row.iloc[j]
+        if pd.notna(x) and str(x).strip():
+            arms.append(f"{j}:{str(x).strip()}")
+    return arms
+
+
+class YieldStats:
+    """アームごとの試行数・新規ドメイン数と、実行ごとの期待/実測レポート"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.arms = {}   # arm -> {"pulls": int, "new_domains": int}
+        self.runs = []
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.arms = data.get("arms", {})
+            self.runs = data.get("runs", [])
+
+    @classmethod
+    def for_dir(cls, base_dir: Path):
+        return cls(Path(base_dir) / "log_Searched" / YIELD_STATS_NAME)
+
+    @property
+    def total_pulls(self):
+        return sum(a["pulls"] for a in self.arms.values())
+
+    @property
+    def has_history(self):
+        return self.total_pulls > 0
+
+    def global_mean(self):
+        pulls = self.total_pulls
+        if not pulls:
+            return 1.0  # 履歴なし: 全アームを同じ楽観値で扱う（選択用。期待収量としては出さない）
+        return sum(a["new_domains"] for a in self.arms.values()) / pulls
+
+    def arm_mean(self, arm, prior):
+        a = self.arms.get(arm)
+        pulls = a["pulls"] if a else 0
+        gained = a["new_domains"] if a else 0
+        return (gained + PRIOR_PULLS * prior) / (pulls + PRIOR_PULLS)
+
+    def expected(self, arms):
+        """行の期待収量（アーム平均の平均）。アームが無ければ 0、履歴が無ければ None"""
+        if not self.has_history:
+            return None
+        if not arms:
+            return 0.0
+        prior = self.global_mean()
+        return sum(self.arm_mean(a, prior) for a in arms) / len(arms)
+
+    def ucb(self, arms, prior, log_n, virtual=None):
+        """virtual（arm -> このバッチで選択済みの回数）の分だけ平均を逓減させ、ボーナスも下げる"""
+        if not arms:
+            return 0.0
+        score = 0.0
+        for arm in arms:
+            v = virtual.get(arm, 0) if virtual else 0
+            pulls = self.arms.get(arm, {}).get("pulls", 0) + v
+            score += self.arm_mean(arm, prior) * BATCH_DECAY ** v + UCB_C * math.sqrt(log_n / (pulls + 1))
+        return score / len(arms)
+
+    def update(self, arms, new_domains):
+        for arm in arms:
+            a = self.arms.setdefault(arm, {"pulls": 0, "new_domains": 0})
+            a["pulls"] += 1
+            a["new_domains"] += new_domains
+
+    def record_run(self, report):
+        self.runs.append(report)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"arms": self.arms, "runs": self.runs}
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(self.path)
+
+
+def expected_total(df, rows, stats: YieldStats):
+    """rows の期待収量の合計（履歴が無ければ None）"""
+    if not stats.has_history:
+        return None
+    return sum(stats.expected(row_arms(df.iloc[i])) for i in rows)
+
+
+def select_rows(df, candidates, n_proc, stats: YieldStats, rng=random):
+    """candidates（df の行番号）から n_proc 行を選び、(選んだ行番号, 期待収量の合計 or None) を返す"""
+    if n_proc >= len(candidates):
+        chosen = list(candidates)
+    else:
+        prior = stats.global_mean()
+        log_n = math.log(stats.total_pulls + len(candidates) + 1)
+        arms_of = {i: row_arms(df.iloc[i]) for i in candidates}
+        n_explore = int(n_proc * EXPLORE_RATE)
+        n_exploit = n_proc - n_explore
+
+        # 貪欲に1行ずつ選ぶ。仮の試行でスコアは下がる一方なので、ヒープの古いスコアは上限として使える
+        # （取り出した行を再計算し、次点の上限以上ならそのまま採用）
+        virtual = {}
+        heap = [(-stats.ucb(arms_of[i], prior, log_n), rng.random(), i) for i in candidates]
+        heapq.heapify(heap)
+        chosen = []
+        while heap and len(chosen) < n_exploit:
+            _, tie, i = heapq.heappop(heap)
+            score = stats.ucb(arms_of[i], prior, log_n, virtual)
+            if heap and -heap[0][0] > score:
+                heapq.heappush(heap, (-score, tie, i))
+                continue
+            chosen.append(i)
+            for arm in arms_of[i]:
+                virtual[arm] = virtual.get(arm, 0) + 1
+        rest = [i for _, _, i in heap]
+        chosen += rng.sample(rest, k=min(n_explore, len(rest)))
+    return chosen, expected_total(df, chosen, stats)
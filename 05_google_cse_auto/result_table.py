@@ -0,0 +1,57 @@
+# 05 の検索結果メタデータのサイドテーブル（列指向）
+# 仕様:
+# - 1結果1行: シート・Excel行番号・クエリ・ページ・順位・URL ID・タイトル・スニペット・表示ドメイン
+#   （URL 本体は url_table.sqlite。Excel のセルには入れない）
+# - シート単位で log_Searched/results(<シート>)_<ファイル名>__<timestamp>.parquet に保存
+#   （pyarrow / fastparquet が無い環境では .csv.gz）
+
+from pathlib import Path
+
+import pandas as pd
+
+COLUMNS = ["sheet", "row", "query", "page", "rank", "url_id", "title", "snippet", "display_domain"]
+
+
+class ResultTable:
+    def __init__(self):
+        self.cols = {c: [] for c in COLUMNS}
+
+    def __len__(self):
+        return len(self.cols["rank"])
+
+    def add(self, sheet, row_idx, query, items, url_table=None):
+        """items（検索結果 dict）を追加する。row_idx は df の行番号（Excel 行番号は +2）"""
+        for item in items:
+            link = item.get("link", "")
+            self.cols["sheet"].append(sheet)
+            self.cols["row"].append(row_idx + 2)
+            self.cols["query"].append(query)
+            self.cols["page"].append(item.get("page", 1))
+            self.cols["rank"].append(item.get("rank"))
+            self.cols["url_id"].append(url_table.lookup(link) if url_table is not None else None)
+            self.cols["title"].append(item.get("title"))
+            self.cols["snippet"].append(item.get("snippet"))
+            self.cols["display_domain"].append((item.get("displayLink") or "").lower())
+
+    def to_frame(self):
+        df = pd.DataFrame(self.cols, columns=COLUMNS)
+        df["row"] = df["row"].astype("int32")
+        df["page"] = df["page"].astype("int8")
+        df["rank"] = df["rank"].astype("Int16")
+        df["url_id"] = df["url_id"].astype("Int64")
+        for c in ("sheet", "query", "display_domain"):
+            df[c] = df[c].astype("category")
+        return df
+
+    def save(self, out_dir: Path, stem: str) -> Path | None:
+        if not len(self):
+            return None
+        out_dir.mkdir(parents=True, exist_ok=True)
+        df = self.to_frame()
+        try:
+            path = out_dir / f"{stem}.parquet"
+            df.to_parquet(path, index=False)
+        except ImportError:
+            path = out_dir / f"{stem}.csv.gz"
+            df.to_csv(path, index=False, encoding="utf-8", compression="gzip")
+        return path
@@ -0,0 +1,64 @@
+# 05 の1行分の処理（クエリ生成 → 検索 → ドメイン重複除去 → セル内容）
+# 仕様:
+# - main.py の行ループから呼ぶ。検索関数は引数で受け取る（ベンチマークでは偽の検索関数を渡す）
+# - 結果ゼロ・検索失敗でも "--- row_start ---" を返して処理済み痕跡を残す
+# - all_domains は呼び出し側（シート単位）で保持し、ここで更新する
+# - url_table を渡すと URL を正規化して永続 URL テーブルに登録し、
+#   store_ids=True ならセルには URL の代わりに "#<id>" を書く
+
+from urllib.parse import urlparse
+
+import pandas as pd
+
+from pipeline_common.url_table import canonicalize_url, format_ids
+
+ROW_START = "--- row_start ---"
+QUERY_COLUMNS = 3
+
+# ==== 独自ドメイン抽出 ====
+
+def get_domain(url):
+    try:
+        netloc = urlparse(url).netloc
+        return netloc.lower().lstrip("www.")
+    except Exception:
+        return url
+
+def build_query(row, n_cols=QUERY_COLUMNS):
+    """先頭 n_cols 列を空白区切りで連結したクエリを返す（すべて空なら None）"""
+    cols = [row.iloc[j] if j < len(row) else None for j in range(n_cols)]
+    if all(pd.isna(x) or str(x).strip() == "" for x in cols):
+        return None
+    return " ".join([str(x) for x in cols if pd.notna(x) and str(x).strip()])
+
+def search_row(query, search_fn, all_domains, metrics=None, url_table=None, seen_at=None, store_ids=False):
+    """query を検索し、searched_URL セルに書き込む文字列を返す"""
+    try:
+        urls = search_fn(query)
+    except Exception as e:
+        print(f"[WARN] 検索失敗: {query} :: {e}")
+        if metrics is not None:
+            metrics.inc("failed_queries")
+        urls = []
+    urls_cleaned = [u.strip() for u in urls if u.strip()]
+    if not urls_cleaned:
+        return ROW_START  # 結果ゼロでも処理済み痕跡
+
+    url_ids = {}
+    if url_table is not None:
+        urls_cleaned = list(dict.fromkeys(canonicalize_url(u) for u in urls_cleaned))
+        # 重複除去で落とす URL も「検索で見えた」ものとして登録する
+        url_ids = dict(zip(urls_cleaned, url_table.intern_many(urls_cleaned, seen_at)))
+
+    # ドメイン重複除去（今回処理分に対して）
+    uniq_urls = []
+    for url in urls_cleaned:
+        domain = get_domain(url)
+        if domain not in all_domains:
+            uniq_urls.append(url)
+            all_domains.add(domain)
+    if metrics is not None:
+        metrics.observe_dedupe(len(urls_cleaned), len(uniq_urls))
+    if url_table is not None and store_ids:
+        return "\n".join([ROW_START] + format_ids(url_ids[u] for u in uniq_urls))
+    return "\n".join([ROW_START] + uniq_urls)
@@ -0,0 +1,214 @@
+# 05 検索パスの計測（レイテンシ・リトライ・待機時間・重複除去・書き戻し）
+# 仕様:
+# - google_search と行ループから記録し、実行ごとに JSON サマリ（metrics_<timestamp>.json）を出力
+# - Prometheus textfile は固定名 crossborder_search.prom を実行ごとに置き換える
+#   （textfile collector はディレクトリ内の *.prom をすべて読むため、ファイルを増やすと系列が重複する）
+# - ヒストグラムは固定バケット（累積カウントは出力時に計算）
+# - 記録はロックで保護（並列検索からの呼び出しも可）
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+METRIC_PREFIX = "crossborder_search"
+PROM_FILE_NAME = f"{METRIC_PREFIX}.prom"
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+RESULTS_BUCKETS = (0, 1, 3, 5, 8, 10, 20, 50, 100)
+PAGES_BUCKETS = (1, 2, 3, 5, 10)
+WRITE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+
+
+class Histogram:
+    """固定バケットのヒストグラム（各バケットは le 以下の件数）"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def cumulative(self):
+        acc, out = 0, []
+        for le, c in zip(self.buckets, self.counts):
+            acc += c
+            out.append((le, acc))
+        return out
+
+    def quantile(self, q):
+        """バケット上限による近似分位点（最上位バケット超は max）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for le, acc in self.cumulative():
+            if acc >= rank:
+                return le
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "buckets": {str(le): acc for le, acc in self.cumulative()},
+        }
+
+
+class SearchMetrics:
+    """1 実行分の検索メトリクス"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.latency = Histogram(LATENCY_BUCKETS)         # API 呼び出し 1 回の実時間（in flight）
+        self.results_per_query = Histogram(RESULTS_BUCKETS)   # 深掘り時は全ページ合計
+        self.pages_per_query = Histogram(PAGES_BUCKETS)
+        self.write_back = {}                               # 種別 -> Histogram
+        self.counters = {
+            "queries": 0,            # 検索した行（クエリ）数。深掘りで複数ページ取っても1
+            "pages": 0,              # 取得したページ数（リトライは含まない）
+            "deep_pages": 0,         # うち2ページ目以降
+            "api_calls": 0,          # execute() 試行数（リトライ含む）
+            "failed_queries": 0,     # リトライ上限などで1ページ目から取得できなかったクエリ
+            "failed_pages": 0,       # リトライ上限などで取得できなかった2ページ目以降
+            "empty_rows": 0,         # クエリ空で処理済みマークのみの行
+            "urls_in": 0,            # ドメイン重複除去前の URL 数
+            "urls_kept": 0,          # ドメイン重複除去後の URL 数
+        }
+        self.retries = {}                                  # ステータス ("429", "503", "error") -> 回数
+        self.seconds = {
+            "in_flight": 0.0,
+            "throttle_wait": 0.0,
+            "backoff": 0.0,
+        }
+
+    # ---- 記録 ----
+    def inc(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_seconds(self, name, sec):
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + sec
+
+    def observe_call(self, sec):
+        with self._lock:
+            self.counters["api_calls"] += 1
+            self.seconds["in_flight"] += sec
+            self.latency.observe(sec)
+
+    def observe_retry(self, status, backoff_sec):
+        key = str(status) if status else "error"
+        with self._lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+            self.seconds["backoff"] += backoff_sec
+
+    def observe_query(self, n_urls, n_pages):
+        """1クエリ（1行）分の結果件数と取得ページ数"""
+        with self._lock:
+            self.counters["queries"] += 1
+            self.results_per_query.observe(n_urls)
+            self.pages_per_query.observe(n_pages)
+
+    def observe_dedupe(self, n_in, n_kept):
+        with self._lock:
+            self.counters["urls_in"] += n_in
+            self.counters["urls_kept"] += n_kept
+
+    @contextmanager
+    def time_write(self, kind):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            sec = time.perf_counter() - t0
+            with self._lock:
+                self.write_back.setdefault(kind, Histogram(WRITE_BUCKETS)).observe(sec)
+
+    # ---- 出力 ----
+    def to_dict(self):
+        with self._lock:
+            urls_in = self.counters["urls_in"]
+            dropped = urls_in - self.counters["urls_kept"]
+            retries_429 = self.retries.get("429", 0)
+            retries_5xx = sum(v for k, v in self.retries.items() if k.isdigit() and 500 <= int(k) < 600)
+            return {
+                "started_at": self.started_at,
+                "wall_seconds": round(time.time() - self.started_at, 3),
+                "counters": dict(self.counters),
+                "retries": dict(self.retries),
+                "retries_429": retries_429,
+                "retries_5xx": retries_5xx,
+                "seconds": {k: round(v, 3) for k, v in self.seconds.items()},
+                "dedupe_drop_rate": round(dropped / urls_in, 4) if urls_in else None,
+                "latency_seconds": self.latency.summary(),
+                "results_per_query": self.results_per_query.summary(),
+                "pages_per_query": self.pages_per_query.summary(),
+                "write_back_seconds": {k: h.summary() for k, h in self.write_back.items()},
+            }
+
+    def to_prometheus(self):
+        p = METRIC_PREFIX
+        lines = []
+
+        def hist(name, h, labels="", help_text=""):
+            if help_text:
+                lines.append(f"# HELP {p}_{name} {help_text}")
+                lines.append(f"# TYPE {p}_{name} histogram")
+            sep = "," if labels else ""
+            for le, acc in h.cumulative():
+                lines.append(f'{p}_{name}_bucket{{{labels}{sep}le="{le}"}} {acc}')
+            lines.append(f'{p}_{name}_bucket{{{labels}{sep}le="+Inf"}} {h.count}')
+            lab = f"{{{labels}}}" if labels else ""
+            lines.append(f"{p}_{name}_sum{lab} {h.sum}")
+            lines.append(f"{p}_{name}_count{lab} {h.count}")
+
+        with self._lock:
+            lines.append(f"# TYPE {p}_last_run_timestamp_seconds gauge")
+            lines.append(f"{p}_last_run_timestamp_seconds {self.started_at:.0f}")
+            for name, v in self.counters.items():
+                lines.append(f"# TYPE {p}_{name}_total counter")
+                lines.append(f"{p}_{name}_total {v}")
+            lines.append(f"# TYPE {p}_retries_total counter")
+            for status, v in sorted(self.retries.items()):
+                lines.append(f'{p}_retries_total{{status="{status}"}} {v}')
+            lines.append(f"# TYPE {p}_seconds_total counter")
+            for phase, v in self.seconds.items():
+                lines.append(f'{p}_seconds_total{{phase="{phase}"}} {v:.6f}')
+            hist("latency_seconds", self.latency, help_text="API call latency (in flight)")
+            hist("results_per_query", self.results_per_query, help_text="URLs returned per query (all pages)")
+            hist("pages_per_query", self.pages_per_query, help_text="Result pages fetched per query")
+            for i, (kind, h) in enumerate(sorted(self.write_back.items())):
+                hist("write_back_seconds", h, labels=f'kind="{kind}"',
+                     help_text="Write-back duration" if i == 0 else "")
+        return "\n".join(lines) + "\n"
+
+    def save(self, out_dir: Path, run_ts: str):
+        """metrics_<run_ts>.json を保存し、out_dir/crossborder_search.prom を今回の値で置き換える"""
+        out_dir.mkdir(parents=True, exist_ok=True)
+        json_path = out_dir / f"metrics_{run_ts}.json"
+        prom_path = out_dir / PROM_FILE_NAME
+        json_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        # textfile collector が途中のファイルを読まないよう一時ファイル経由で置換
+        tmp = prom_path.with_suffix(".prom.tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        tmp.replace(prom_path)
+        return json_path, prom_path
@@ -0,0 +1,113 @@
+# 07 の転記処理（row_list_*.txt の解析・参照ログ探索・シートへの書き込み・対象シートのみのブック作成）
+# main.py から呼ぶ。ベンチマークからも同じ関数を使う。
+
+import openpyxl
+from pathlib import Path
+from datetime import datetime
+
+URL_COLUMNS = ("diff_URL", "filterling_URL")
+
+# =========================
+# ユーティリティ
+# =========================
+def get_unique_path(path: Path) -> Path:
+    """同名ファイルが存在する場合、(1),(2)... を付けて重複回避する"""
+    if not path.exists():
+        return path
+    stem, suffix, parent = path.stem, path.suffix, path.parent
+    i = 1
+    while True:
+        candidate = parent / f"{stem}({i}){suffix}"
+        if not candidate.exists():
+            return candidate
+        i += 1
+
+def parse_row_list_file(filepath: Path):
+    """row_list_*.txt を解析し、(diff_URL, filterling_URL) のリストを返す"""
+    with open(filepath, "r", encoding="utf-8") as f:
+        content = f.read()
+    blocks = [b.strip() for b in content.split("--- row_start ---") if b.strip()]
+    results = []
+    for block in blocks:
+        lines = [line.strip() for line in block.splitlines() if line.strip()]
+        diff_urls, filter_urls = [], []
+        if "diff_URL:" in lines:
+            diff_start = lines.index("diff_URL:") + 1
+            if "filterling_URL:" in lines:
+                filter_start = lines.index("filterling_URL:")
+                diff_urls = lines[diff_start:filter_start]
+                filter_urls = lines[filter_start + 1:]
+            else:
+                diff_urls = lines[diff_start:]
+                filter_urls = []
+        # ノイズ除去
+        filter_urls = [u for u in filter_urls if u != "（なし）" and not u.startswith("--- row_start ---")]
+        results.append(("\n".join(diff_urls), "\n".join(filter_urls)))
+    return results
+
+def find_latest_sparse_log(base_dir: Path, genre: str) -> Path | None:
+    """
+    base_dir（=ファイルAがあるディレクトリ）直下 log_Searched/ から、
+    searched(genre)_Keyword-list_*__log_*.xlsx（or .csv） の最新を返す
+    """
+    log_dir = base_dir / "log_Searched"
+    if not log_dir.exists():
+        return None
+    patterns = [
+        f"searched({genre})_Keyword-list_*__log_*.xlsx",
+        f"searched({genre})_Keyword-list_*__log_*.csv",
+    ]
+    cands = []
+    for pat in patterns:
+        cands.extend(sorted(log_dir.glob(pat)))
+    if not cands:
+        return None
+    def parse_ts(p: Path):
+        try:
+            ts = p.stem.split("__log_")[-1]
+            return datetime.strptime(ts, "%Y%m%d-%H%M%S")
+        except Exception:
+            return datetime.fromtimestamp(p.stat().st_mtime)
+    cands.sort(key=parse_ts, reverse=True)
+    return cands[0]
+
+def ensure_url_columns(ws):
+    """diff_URL / filterling_URL 列が無ければヘッダ行の末尾に作成し、(diff列, filter列) を返す"""
+    headers = {cell.value: col_idx for col_idx, cell in enumerate(ws[1], start=1)}
+    changed = False
+    for need in URL_COLUMNS:
+        if need not in headers:
+            ws.cell(row=1, column=ws.max_column + 1).value = need
+            headers[need] = ws.max_column
+            changed = True
+    if changed:
+        headers = {cell.value: col_idx for col_idx, cell in enumerate(ws[1], start=1)}
+    return headers["diff_URL"], headers["filterling_URL"]
+
+def write_row_sets(ws, row_sets, target_rows, diff_col, filter_col):
+    """target_rows の各行に row_sets の (diff_URL, filterling_URL) を上書きし、書き込んだ行数を返す"""
+    written = 0
+    for tgt_row, (diff_str, filter_str) in zip(target_rows, row_sets):
+        ws.cell(row=tgt_row, column=diff_col).value = diff_str
+        ws.cell(row=tgt_row, column=filter_col).value = filter_str
+        written += 1
+    return written
+
+def find_column(ws, name):
+    """ヘッダ行で name の列番号（1始まり）を返す。無ければ None"""
+    return next((col_idx for col_idx, cell in enumerate(ws[1], start=1) if cell.value == name), None)
+
+def copy_sheet_only(ws, value_fn=None, columns=None):
+    """ws の値だけを持つ同名シート1枚の新規ブックを返す
+    （value_fn があれば 2行目以降の columns（列番号の集合。None なら全列）の値に適用）"""
+    new_wb = openpyxl.Workbook()
+    default_ws = new_wb.active
+    new_wb.remove(default_ws)
+
+    nws = new_wb.create_sheet(ws.title)
+    for r_idx, row in enumerate(ws.iter_rows(values_only=True), start=1):
+        for c_idx, v in enumerate(row, start=1):
+            if value_fn is not None and r_idx > 1 and (columns is None or c_idx in columns):
+                v = value_fn(v)
+            nws.cell(row=r_idx, column=c_idx).value = v
+    return new_wb
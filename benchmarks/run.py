@@ -0,0 +1,294 @@
+# 04 / 05 / 07 のベンチマーク（オフライン・合成データ）
+# 使い方:
+#   python benchmarks/run.py --scale small                   # 計測して結果を表示
+#   python benchmarks/run.py --scale medium --save main      # baselines/main.json に保存
+#   python benchmarks/run.py --scale medium --compare main   # 基準と比較（劣化があれば終了コード 1）
+# 仕様:
+# - stage04_ingest    : Keyword-list の読み込み（キャッシュなし）。phases に再実行（キャッシュあり）の時間
+# - stage04_write_csv : write_csv_in_parts_unique の書き出しスループット（rows/s）
+# - stage05_rows      : 1行処理（クエリ生成→偽検索→URL 正規化・URL テーブル登録→ドメイン重複除去）のスループット
+# - stage07_transcribe: row_list 解析→ブック読込→転記→対象シートのみのブック保存
+# - 各ベンチは --repeat 回実行して中央値を採用
+
+import argparse
+import importlib.util
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import product
+from math import prod
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+BASELINE_DIR = BENCH_DIR / "baselines"
+
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "04_all_combinations_auto"))
+sys.path.insert(0, str(ROOT_DIR / "05_google_cse_auto"))
+sys.path.insert(0, str(ROOT_DIR / "07_transcribe_auto"))
+
+import openpyxl
+import pandas as pd
+
+from synth import FakeSearch, make_keyword_list, make_row_list_txt, vocab
+
+SCALES = {
+    "small":  {"columns": 3, "uniques": 20,  "sheets": 1, "rows": 500},
+    "medium": {"columns": 3, "uniques": 60,  "sheets": 2, "rows": 5_000},
+    "large":  {"columns": 3, "uniques": 150, "sheets": 4, "rows": 20_000},
+}
+
+
+def load_stage04():
+    """04_all_combinations_auto/main.py をモジュールとして読み込む（main() は実行しない）"""
+    path = ROOT_DIR / "04_all_combinations_auto" / "main.py"
+    spec = importlib.util.spec_from_file_location("stage04_main", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# =========================
+# 各ベンチマーク（1回分）: {"seconds", "rows", "phases"} を返す
+# =========================
+
+def bench_stage04_ingest(scale, work: Path):
+    import shutil
+    from keyword_ingest import CACHE_DIR_NAME
+
+    stage04 = load_stage04()
+    xlsx = work / "Keyword-list_bench04.xlsx"
+    if not xlsx.exists():
+        make_keyword_list(xlsx, scale["columns"], scale["uniques"], scale["sheets"], scale["rows"])
+    shutil.rmtree(work / CACHE_DIR_NAME, ignore_errors=True)
+
+    t0 = time.perf_counter()
+    stage04.load_value_lists(xlsx, lambda cols: cols)
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    stage04.load_value_lists(xlsx, lambda cols: cols)
+    warm = time.perf_counter() - t0
+    return {"seconds": cold, "rows": scale["rows"], "phases": {"cold": cold, "cached": warm}}
+
+
+def bench_stage04_write_csv(scale, work: Path):
+    stage04 = load_stage04()
+    value_lists = [vocab(c, scale["uniques"]) for c in range(scale["columns"])]
+    headers = [f"col{c}" for c in range(scale["columns"])]
+    total = prod(len(v) for v in value_lists)
+    out_dir = Path(tempfile.mkdtemp(dir=work))
+    t0 = time.perf_counter()
+    written, _, _ = stage04.write_csv_in_parts_unique(
+        out_dir / "AllCombinations_bench.csv", headers, product(*value_lists), total
+    )
+    return {"seconds": time.perf_counter() - t0, "rows": written, "phases": {}}
+
+
+def bench_stage05_rows(scale, work: Path):
+    from pipeline_common.url_table import UrlTable
+    from row_search import ROW_START, build_query, search_row
+    from search_metrics import SearchMetrics
+
+    xlsx = work / "Keyword-list_bench05.xlsx"
+    if not xlsx.exists():
+        make_keyword_list(xlsx, scale["columns"], scale["uniques"], 1, scale["rows"], with_searched_url=True)
+    df = pd.read_excel(xlsx, sheet_name="Sheet1")
+    df["searched_URL"] = df["searched_URL"].astype(object)  # 空列は float64 で読まれるため
+    search = FakeSearch()
+    metrics = SearchMetrics()
+    # 本番と同じく URL テーブル（正規化 + SQLite 登録）を通す。毎回空のテーブルから始める
+    url_table = UrlTable(Path(tempfile.mkdtemp(dir=work)) / "url_table.sqlite")
+    seen_at = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    t0 = time.perf_counter()
+    all_domains = set()
+    for i in df.index:
+        query = build_query(df.iloc[i])
+        if query is None:
+            df.at[i, "searched_URL"] = ROW_START
+            continue
+        df.at[i, "searched_URL"] = search_row(query, search, all_domains, metrics,
+                                              url_table=url_table, seen_at=seen_at)
+    url_table.commit()
+    seconds = time.perf_counter() - t0
+    url_table.close()
+    return {
+        "seconds": seconds,
+        "rows": len(df),
+        "phases": {"dedupe_drop_rate": metrics.to_dict()["dedupe_drop_rate"]},
+    }
+
+
+def bench_stage07_transcribe(scale, work: Path):
+    from transcribe import copy_sheet_only, ensure_url_columns, parse_row_list_file, write_row_sets
+
+    xlsx = work / "Keyword-list_bench07.xlsx"
+    txt = work / "row_list_Sheet1.txt"
+    if not xlsx.exists():
+        make_keyword_list(xlsx, scale["columns"], scale["uniques"], scale["sheets"], scale["rows"],
+                          with_searched_url=True)
+    if not txt.exists():
+        make_row_list_txt(txt, scale["rows"])
+
+    phases = {}
+    t_all = time.perf_counter()
+
+    t0 = time.perf_counter()
+    row_sets = parse_row_list_file(txt)
+    phases["parse_row_list_file"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    wb = openpyxl.load_workbook(xlsx)
+    phases["load_workbook"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ws = wb["Sheet1"]
+    diff_col, filter_col = ensure_url_columns(ws)
+    target_rows = list(range(2, 2 + len(row_sets)))
+    written = write_row_sets(ws, row_sets, target_rows, diff_col, filter_col)
+    phases["write_cells"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    new_wb = copy_sheet_only(ws)
+    phases["copy_sheet"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    out_dir = Path(tempfile.mkdtemp(dir=work))
+    new_wb.save(out_dir / "trsc(Sheet1)_bench.xlsx")
+    phases["save_workbook"] = time.perf_counter() - t0
+
+    return {"seconds": time.perf_counter() - t_all, "rows": written, "phases": phases}
+
+
+BENCHMARKS = {
+    "stage04_ingest": bench_stage04_ingest,
+    "stage04_write_csv": bench_stage04_write_csv,
+    "stage05_rows": bench_stage05_rows,
+    "stage07_transcribe": bench_stage07_transcribe,
+}
+
+
+# =========================
+# 実行・保存・比較
+# =========================
+
+def run_benchmarks(scale, names, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="crossborder_bench_") as tmp:
+        work = Path(tmp)
+        for name in names:
+            runs = [BENCHMARKS[name](scale, work) for _ in range(repeat)]
+            seconds = [r["seconds"] for r in runs]
+            med = statistics.median(seconds)
+            rows = runs[0]["rows"]
+            phases = {}
+            for key in runs[0]["phases"]:
+                vals = [r["phases"][key] for r in runs if r["phases"].get(key) is not None]
+                phases[key] = round(statistics.median(vals), 6) if vals else None
+            results[name] = {
+                "rows": rows,
+                "seconds_median": round(med, 6),
+                "seconds_all": [round(s, 6) for s in seconds],
+                "rows_per_s": round(rows / med, 1) if med > 0 else None,
+                "phases": phases,
+            }
+            print(f"  {name:<20} {rows:>10,} rows  {med:>9.3f}s  {results[name]['rows_per_s'] or 0:>12,.0f} rows/s")
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "pandas": pd.__version__,
+        "openpyxl": openpyxl.__version__,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """rows/s が基準の (1 - tolerance) 倍を下回ったベンチ名のリストを返す"""
+    if current["scale"] != baseline["scale"]:
+        print(f"[WARN] スケールが基準と異なります: 今回={current['scale']} / 基準={baseline['scale']}")
+    regressions = []
+    print(f"\n▼ 基準との比較（許容低下 {tolerance:.0%}）")
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base or not base.get("rows_per_s") or not cur.get("rows_per_s"):
+            print(f"  {name:<20} 基準なし")
+            continue
+        ratio = cur["rows_per_s"] / base["rows_per_s"]
+        mark = "OK"
+        if ratio < 1 - tolerance:
+            mark = "REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<20} {base['rows_per_s']:>12,.0f} → {cur['rows_per_s']:>12,.0f} rows/s  x{ratio:.2f}  {mark}")
+    return regressions
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="crossborder-research-pipeline のオフラインベンチマーク")
+    ap.add_argument("--scale", choices=sorted(SCALES), default="small")
+    ap.add_argument("--columns", type=int, help="列数（スケール既定値を上書き）")
+    ap.add_argument("--uniques", type=int, help="列ごとのユニーク数")
+    ap.add_argument("--sheets", type=int, help="シート数")
+    ap.add_argument("--rows", type=int, help="シートあたり行数")
+    ap.add_argument("--only", help="実行するベンチ名（カンマ区切り）")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--save", metavar="NAME", help="結果を baselines/NAME.json に保存")
+    ap.add_argument("--compare", metavar="NAME", help="baselines/NAME.json と比較")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="許容する rows/s の低下率")
+    ap.add_argument("--output", type=Path, help="今回の結果 JSON の保存先")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scale = dict(SCALES[args.scale])
+    for key in ("columns", "uniques", "sheets", "rows"):
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    names = list(BENCHMARKS)
+    if args.only:
+        names = [n.strip() for n in args.only.split(",") if n.strip()]
+        unknown = [n for n in names if n not in BENCHMARKS]
+        if unknown:
+            raise SystemExit(f"不明なベンチ名: {unknown}（候補: {list(BENCHMARKS)}）")
+
+    print(f"▼ ベンチマーク: scale={args.scale} {scale} repeat={args.repeat}")
+    results = run_benchmarks(scale, names, args.repeat)
+    current = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "scale_name": args.scale,
+        "scale": scale,
+        "repeat": args.repeat,
+        "env": environment(),
+        "results": results,
+    }
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"📝 結果出力: {args.output}")
+    if args.save:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        out = BASELINE_DIR / f"{args.save}.json"
+        out.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"💾 基準を保存: {out}")
+    if args.compare:
+        path = BASELINE_DIR / f"{args.compare}.json"
+        if not path.exists():
+            raise SystemExit(f"基準が見つかりません: {path}")
+        baseline = json.loads(path.read_text(encoding="utf-8"))
+        if compare(current, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# ベンチマーク用の合成データ生成（Keyword-list_*.xlsx と row_list_*.txt）
+# 仕様:
+# - Keyword-list: 列数・列ごとのユニーク数・シート数・行数を指定（seed で再現可能）
+#   各セルは列ごとの語彙プールから選ぶので、04 から見ると列ごとに最大 uniques 個のユニーク値になる
+# - row_list: 06 の出力形式（--- row_start --- / diff_URL: / filterling_URL:）を n_rows ブロック生成
+
+import random
+from pathlib import Path
+
+import openpyxl
+
+ROW_START = "--- row_start ---"
+
+
+def vocab(col_idx: int, uniques: int):
+    return [f"kw{col_idx}_{i:05d}" for i in range(uniques)]
+
+
+def fake_url(rng: random.Random, n_domains: int):
+    d = rng.randrange(n_domains)
+    return f"https://www.site{d:05d}.example.com/item/{rng.randrange(10**6)}"
+
+
+def make_keyword_list(path: Path, n_columns=3, uniques=50, n_sheets=1, n_rows=1000, seed=0,
+                      with_searched_url=False) -> Path:
+    """Keyword-list 形式のブックを作成する（1枚目は Sheet1、以降は genre02, genre03, ...）"""
+    rng = random.Random(seed)
+    pools = [vocab(c, uniques) for c in range(n_columns)]
+    headers = [chr(ord("A") + c) if c < 26 else f"col{c}" for c in range(n_columns)]
+    if with_searched_url:
+        headers.append("searched_URL")
+
+    wb = openpyxl.Workbook(write_only=True)
+    for s in range(n_sheets):
+        ws = wb.create_sheet("Sheet1" if s == 0 else f"genre{s + 1:02d}")
+        ws.append(headers)
+        for r in range(n_rows):
+            # 先頭 uniques 行は各語彙を一巡させ、ユニーク数を指定どおりにする
+            row = [pool[r] if r < uniques else rng.choice(pool) for pool in pools]
+            if with_searched_url:
+                row.append(None)
+            ws.append(row)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(path)
+    return path
+
+
+def make_row_list_txt(path: Path, n_rows=1000, urls_per_row=5, n_domains=2000, seed=0) -> Path:
+    """row_list_*.txt（06 の出力形式）を作成する"""
+    rng = random.Random(seed)
+    blocks = []
+    for _ in range(n_rows):
+        n_diff = rng.randint(0, urls_per_row)
+        n_filter = rng.randint(0, max(0, urls_per_row - n_diff))
+        lines = [ROW_START, "diff_URL:"]
+        lines += [fake_url(rng, n_domains) for _ in range(n_diff)]
+        lines.append("filterling_URL:")
+        lines += [fake_url(rng, n_domains) for _ in range(n_filter)] or ["（なし）"]
+        blocks.append("\n".join(lines))
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n\n".join(blocks) + "\n", encoding="utf-8")
+    return path
+
+
+class FakeSearch:
+    """google_search の代わりに使う決定的な偽検索（通信なし）"""
+
+    def __init__(self, n_domains=2000, results=10, seed=0):
+        self.n_domains = n_domains
+        self.results = results
+        self.seed = seed
+        self.calls = 0
+
+    def __call__(self, query):
+        self.calls += 1
+        rng = random.Random(f"{self.seed}:{query}")
+        return [fake_url(rng, self.n_domains) for _ in range(self.results)]
@@ -0,0 +1,2 @@
+# 04 / 05 / 07 の各スクリプトから共通で使うユーティリティ
+# （各 main.py は親ディレクトリを sys.path に追加して import する）
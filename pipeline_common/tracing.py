@@ -0,0 +1,210 @@
+# ステージ横断のトレース（スパン計測）と任意のプロファイリング
+# 仕様:
+# - Tracer.span() で入れ子のスパンを計測し、1実行につき1つの JSONL に保存
+#   （log_trace/trace_<stage>_<timestamp>.jsonl、1行1スパン、終了順）
+# - スパンには rows などの任意属性を付与できる（span.set(rows=...)）
+# - ループ内で時間を区切って計る用途には Tracer.record() を使う
+# - "--profile" 引数 または 環境変数 PIPELINE_PROFILE=1 のときだけ
+#   StageProfiler が cProfile / tracemalloc を有効化し、出力先に保存する
+# - 対話入力中は StageProfiler.ask() / paused() でプロファイルを止める（入力待ちで結果が埋もれないように）
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_FLAG = "--profile"
+PROFILE_ENV = "PIPELINE_PROFILE"
+
+
+def profiling_requested(argv=None) -> bool:
+    argv = sys.argv[1:] if argv is None else argv
+    return PROFILE_FLAG in argv or os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+class Span:
+    def __init__(self, tracer, name, parent_id, depth, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = tracer._next_id()
+        self.parent_id = parent_id
+        self.depth = depth
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, **attrs):
+        """begin() で開始したスパンを終了する（with を使わない箇所向け）"""
+        if self.duration is not None:
+            return
+        self.attrs.update(attrs)
+        self.duration = time.perf_counter() - self._t0
+        self.tracer._finish(self)
+
+    def to_dict(self):
+        d = {
+            "stage": self.tracer.stage,
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "depth": self.depth,
+            "start": datetime.fromtimestamp(self.start).isoformat(timespec="milliseconds"),
+            "duration_s": round(self.duration, 6) if self.duration is not None else None,
+        }
+        d.update(self.attrs)
+        return d
+
+
+class Tracer:
+    """1実行分のスパンをメモリに溜め、save() で JSONL に書き出す"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.run_ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._id = 0
+
+    def _next_id(self):
+        with self._lock:
+            self._id += 1
+            return self._id
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _finish(self, span):
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        with self._lock:
+            self.spans.append(span)
+
+    def begin(self, name, **attrs) -> Span:
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(self, name, parent.span_id if parent else None, len(stack), attrs)
+        stack.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = self.begin(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end()
+
+    def record(self, name, duration, **attrs):
+        """計測済みの区間（秒）を現在のスパンの子として追加する"""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(self, name, parent.span_id if parent else None, len(stack), attrs)
+        span.start -= duration
+        span.duration = duration
+        with self._lock:
+            self.spans.append(span)
+
+    def save(self, out_dir: Path) -> Path:
+        out_dir = Path(out_dir) / "log_trace"
+        out_dir.mkdir(parents=True, exist_ok=True)
+        out_path = out_dir / f"trace_{self.stage}_{self.run_ts}.jsonl"
+        with self._lock:
+            spans = list(self.spans)
+        with open(out_path, "w", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n")
+        return out_path
+
+
+class StageProfiler:
+    """cProfile + tracemalloc をまとめて開始/停止する（enabled=False なら何もしない）"""
+
+    def __init__(self, stage: str, enabled: bool | None = None, top_n: int = 40):
+        self.stage = stage
+        self.enabled = profiling_requested() if enabled is None else enabled
+        self.top_n = top_n
+        self._prof = None
+
+    def start(self):
+        if not self.enabled:
+            return self
+        tracemalloc.start()
+        self._prof = cProfile.Profile()
+        self._prof.enable()
+        return self
+
+    def stop(self, out_dir: Path, run_ts: str | None = None):
+        """プロファイルを out_dir に保存し、保存したパスのリストを返す"""
+        if not self.enabled or self._prof is None:
+            return []
+        self._prof.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        run_ts = run_ts or datetime.now().strftime("%Y%m%d-%H%M%S")
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"profile_{self.stage}_{run_ts}"
+
+        prof_path = out_dir / f"{stem}.prof"
+        self._prof.dump_stats(str(prof_path))
+
+        buf = io.StringIO()
+        pstats.Stats(self._prof, stream=buf).sort_stats("cumulative").print_stats(self.top_n)
+        txt_path = out_dir / f"{stem}.txt"
+        txt_path.write_text(buf.getvalue(), encoding="utf-8")
+
+        mem_lines = [f"current={current:,} bytes / peak={peak:,} bytes", ""]
+        for stat in snapshot.statistics("lineno")[:self.top_n]:
+            mem_lines.append(str(stat))
+        mem_path = out_dir / f"{stem}_tracemalloc.txt"
+        mem_path.write_text("\n".join(mem_lines) + "\n", encoding="utf-8")
+
+        self._prof = None
+        return [prof_path, txt_path, mem_path]
+
+    @contextmanager
+    def paused(self):
+        """対話入力の待ち時間などを CPU プロファイルに含めないよう一時停止する"""
+        if self._prof is None:
+            yield self
+            return
+        self._prof.disable()
+        try:
+            yield self
+        finally:
+            self._prof.enable()
+
+    def ask(self, prompt: str) -> str:
+        """プロファイルを止めた状態で input() する"""
+        with self.paused():
+            return input(prompt)
+
+    @contextmanager
+    def profile(self, out_dir: Path, run_ts: str | None = None):
+        self.start()
+        try:
+            yield self
+        finally:
+            for p in self.stop(out_dir, run_ts):
+                print(f"🔬 プロファイル出力: {p}")
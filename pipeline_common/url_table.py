@@ -0,0 +1,216 @@
+# URL の正規化と永続 URL テーブル（整数 ID で参照）
+# 仕様:
+# - canonicalize_url: ホスト小文字化・既定ポート除去・トラッキング引数（utm_* / gclid など）除去・
+#   フラグメント除去・末尾スラッシュ統一（ルート以外は除去）
+#   （結果はセルにも書くため、IPv6 の角括弧や残りのクエリ文字列は元の表記のまま保つ）
+# - UrlTable: 正規化済み URL を SQLite に1件1行で保存し、整数 ID を払い出す
+#   （first_seen / last_seen / seen_count を保持）
+# - セルには "#<id>" を1行1件で書ける。expand_cell で URL に戻す
+
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+URL_TABLE_NAME = "url_table.sqlite"
+ID_PREFIX = "#"
+ID_LINE_RE = re.compile(r"^#(\d+)$")
+
+TRACKING_PREFIXES = ("utm_",)
+TRACKING_PARAMS = {
+    "gclid", "gbraid", "wbraid", "dclid", "fbclid", "msclkid", "yclid",
+    "_ga", "_gl", "mc_cid", "mc_eid", "igshid", "srsltid",
+}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+ROW_COLUMNS = ["id", "url", "host", "first_seen", "last_seen", "seen_count"]
+
+
+def is_tracking_param(key: str) -> bool:
+    k = key.lower()
+    return k in TRACKING_PARAMS or k.startswith(TRACKING_PREFIXES)
+
+
+def split_host_port(hostport: str):
+    """"host[:port]" / "[v6]:port" を (host, port文字列) に分ける（IPv6 の角括弧は host に残す）"""
+    if hostport.startswith("["):
+        end = hostport.find("]")
+        if end != -1:
+            rest = hostport[end + 1:]
+            return hostport[:end + 1], rest[1:] if rest.startswith(":") else ""
+    host, sep, port = hostport.rpartition(":")
+    if not sep:
+        return hostport, ""
+    return host, port
+
+
+def strip_tracking_query(query: str) -> str:
+    """トラッキング引数の組だけを除き、残りはエンコード・並び・値なしキーも含めてそのまま返す"""
+    if not query:
+        return query
+    kept = [p for p in query.split("&") if not is_tracking_param(unquote_plus(p.split("=", 1)[0]))]
+    return "&".join(kept)
+
+
+def canonicalize_url(url: str) -> str:
+    """比較・保存用の正規形を返す（URL として解釈できなければ前後空白を除いた文字列）"""
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.netloc:
+        return url
+
+    scheme = parts.scheme.lower()
+    # netloc は元の文字列から組み立て直す（hostname を使うと IPv6 の角括弧が落ちる）
+    userinfo, at, hostport = parts.netloc.rpartition("@")
+    host, port = split_host_port(hostport)
+    netloc = f"{userinfo}{at}{host.lower()}"
+    if port and not (port.isdigit() and int(port) == DEFAULT_PORTS.get(scheme)):
+        netloc = f"{netloc}:{port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    return urlunsplit((scheme, netloc, path, strip_tracking_query(parts.query), ""))
+
+
+def url_host(canonical_url: str) -> str:
+    try:
+        return (urlsplit(canonical_url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def format_ids(ids) -> list:
+    return [f"{ID_PREFIX}{i}" for i in ids]
+
+
+class UrlTable:
+    """正規化済み URL → 整数 ID の永続テーブル（SQLite）"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS urls (
+                   id INTEGER PRIMARY KEY,
+                   url TEXT NOT NULL UNIQUE,
+                   host TEXT NOT NULL,
+                   first_seen TEXT NOT NULL,
+                   last_seen TEXT NOT NULL,
+                   seen_count INTEGER NOT NULL DEFAULT 0
+               )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_urls_host ON urls(host)")
+        self.conn.commit()
+        self._ids = {}          # url -> id（このプロセスでの参照キャッシュ）
+        self._urls = {}         # id -> url
+        self.new_ids = []       # このプロセスで初めて登録した ID（登録順）
+        self.new_hosts = set()  # このプロセスで初めて現れたホスト（新規候補サイト）
+
+    @classmethod
+    def for_dir(cls, base_dir: Path):
+        """base_dir/log_Searched/url_table.sqlite を開く（無ければ作成）"""
+        return cls(Path(base_dir) / "log_Searched" / URL_TABLE_NAME)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    # ---- 登録 ----
+    def intern(self, url: str, seen_at: str | None = None) -> int:
+        """URL を正規化して登録し ID を返す（既存なら last_seen / seen_count を更新）"""
+        canon = canonicalize_url(url)
+        seen_at = seen_at or datetime.now().strftime("%Y%m%d-%H%M%S")
+        url_id = self._ids.get(canon)
+        if url_id is None:
+            row = self.conn.execute("SELECT id FROM urls WHERE url = ?", (canon,)).fetchone()
+            if row is None:
+                host = url_host(canon)
+                if host not in self.new_hosts and not self.known_host(host):
+                    self.new_hosts.add(host)
+                cur = self.conn.execute(
+                    "INSERT INTO urls (url, host, first_seen, last_seen, seen_count) VALUES (?, ?, ?, ?, 1)",
+                    (canon, host, seen_at, seen_at),
+                )
+                url_id = cur.lastrowid
+                self.new_ids.append(url_id)
+                self._ids[canon] = url_id
+                self._urls[url_id] = canon
+                return url_id
+            url_id = row[0]
+            self._ids[canon] = url_id
+            self._urls[url_id] = canon
+        self.conn.execute(
+            "UPDATE urls SET last_seen = ?, seen_count = seen_count + 1 WHERE id = ?",
+            (seen_at, url_id),
+        )
+        return url_id
+
+    def intern_many(self, urls, seen_at: str | None = None) -> list:
+        return [self.intern(u, seen_at) for u in urls]
+
+    # ---- 参照 ----
+    def url(self, url_id: int) -> str | None:
+        if url_id in self._urls:
+            return self._urls[url_id]
+        row = self.conn.execute("SELECT url FROM urls WHERE id = ?", (url_id,)).fetchone()
+        if row is None:
+            return None
+        self._urls[url_id] = row[0]
+        return row[0]
+
+    def lookup(self, url: str) -> int | None:
+        """正規化した URL の ID を返す（未登録なら None。last_seen は更新しない）"""
+        canon = canonicalize_url(url)
+        if canon in self._ids:
+            return self._ids[canon]
+        row = self.conn.execute("SELECT id FROM urls WHERE url = ?", (canon,)).fetchone()
+        return row[0] if row else None
+
+    def expand(self, ids) -> list:
+        return [self.url(i) for i in ids]
+
+    def known_host(self, host: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM urls WHERE host = ? LIMIT 1", (host,)).fetchone() is not None
+
+    def rows(self, ids):
+        """ROW_COLUMNS の順のタプルを ID 順に返す"""
+        ids = list(ids)
+        out = []
+        for k in range(0, len(ids), 500):
+            chunk = ids[k:k + 500]
+            marks = ",".join("?" * len(chunk))
+            out += self.conn.execute(
+                f"SELECT {', '.join(ROW_COLUMNS)} FROM urls WHERE id IN ({marks})",
+                chunk,
+            ).fetchall()
+        return sorted(out)
+
+
+def expand_cell(value, table: UrlTable):
+    """セル内の "#<id>" 行を URL に展開する（それ以外の行・値はそのまま）"""
+    if not isinstance(value, str) or ID_PREFIX not in value:
+        return value
+    lines = []
+    for line in value.split("\n"):
+        m = ID_LINE_RE.match(line.strip())
+        if m:
+            url = table.url(int(m.group(1)))
+            lines.append(url if url is not None else line)
+        else:
+            lines.append(line)
+    return "\n".join(lines)